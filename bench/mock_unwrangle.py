@@ -0,0 +1,195 @@
+"""Local Unwrangle stand-in - replays recorded or synthetic search/detail payloads with configurable latency, errors and throttling"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+import zlib
+from typing import Optional
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+def _key(platform: str, params: dict) -> tuple:
+    if platform == "fergusonhome_search":
+        return platform, " ".join(params.get("search", "").split()).upper(), int(params.get("page", 1))
+    return platform, urllib.parse.unquote(params.get("url", ""))
+
+class Recordings:
+    """
+    Recorded responses, one JSON object per line:
+      {"platform": "fergusonhome_search", "search": "K-97621-SHP", "page": 1, "response": {...}}
+      {"platform": "fergusonhome_detail", "url": "https://www.fergusonhome.com/...", "response": {...}}
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.responses = {}
+        if path:
+            try:
+                with open(path) as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self.responses[_key(entry["platform"], entry)] = entry["response"]
+            except FileNotFoundError:
+                pass
+
+    def get(self, platform: str, params: dict) -> Optional[dict]:
+        return self.responses.get(_key(platform, params))
+
+    def add(self, platform: str, params: dict, response: dict):
+        self.responses[_key(platform, params)] = response
+        entry = {"platform": platform, "response": response}
+        if platform == "fergusonhome_search":
+            entry.update(search=params.get("search", ""), page=int(params.get("page", 1)))
+        else:
+            entry["url"] = urllib.parse.unquote(params.get("url", ""))
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+def _stable_hash(value) -> int:
+    return zlib.crc32(repr(value).encode())  # unlike hash(), stable across processes
+
+class Synthetic:
+    """
+    Deterministic payloads for any query. A search for MODEL returns
+    products_per_page products whose variants include MODEL on match_page of
+    `pages` pages; details echo the model in the URL with spec_count specs.
+    """
+
+    def __init__(self, pages: int = 1, match_page: int = 1, products_per_page: int = 10, spec_count: int = 40):
+        self.pages = pages
+        self.match_page = match_page
+        self.products_per_page = products_per_page
+        self.spec_count = spec_count
+
+    @staticmethod
+    def _url(model: str) -> str:
+        return f"https://www.fergusonhome.com/mock/p/{urllib.parse.quote(model, safe='')}"
+
+    def search(self, query: str, page: int) -> dict:
+        seed = _stable_hash((query, page)) % 100000
+        results = []
+        if page <= self.pages:
+            for i in range(self.products_per_page):
+                models = [f"{query}-{page}{i}{suffix}" for suffix in ("", "-BN", "-CP")]
+                if page == self.match_page and i == 0:
+                    models[0] = query
+                results.append({"id": seed * 100 + i, "family_id": seed, "name": f"Mock product {query} {page}.{i}", "brand": "Mock",
+                                "price": 100.0 + i, "price_min": 90.0, "price_max": 120.0, "currency": "USD", "collection": "Bench",
+                                "rating": 4.5, "total_ratings": 12, "is_quick_ship": True, "images": [f"https://img.mock/{seed}/{i}.jpg"],
+                                "variants": [{"model_no": m, "url": self._url(m), "price": 100.0 + i, "in_stock": True} for m in models]})
+        return {"success": True, "platform": "fergusonhome_search", "search": query, "page": page, "no_of_pages": self.pages,
+                "result_count": len(results), "total_results": self.pages * self.products_per_page, "results": results,
+                "meta_data": {"mock": True}, "credits_used": 10}
+
+    def detail(self, url: str) -> dict:
+        model = urllib.parse.unquote(url.rstrip("/").rsplit("/", 1)[-1])
+        return {"success": True, "platform": "fergusonhome_detail", "url": url, "credits_used": 10, "detail": {
+            "id": _stable_hash(model) % 10 ** 8, "name": f"Mock product {model}", "brand": "Mock", "model_number": model, "url": url,
+            "price": 100.0, "currency": "USD", "description": "Benchmark product. " * 20, "upc": f"{_stable_hash(model):012d}",
+            "images": [f"https://img.mock/{model}/{i}.jpg" for i in range(8)], "categories": [{"name": "Bench"}, {"name": "Mock"}],
+            "specifications": {f"Spec {i}": f"Value {i}" for i in range(self.spec_count)},
+            "variants": [{"model_no": model, "url": url, "price": 100.0, "in_stock": True}], "total_inventory_quantity": 25}}
+
+class Throttle:
+    """Token bucket - requests beyond `rate` per second get 429 with Retry-After."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+def create_app(latency: float = 0.3, jitter: float = 0.3, error_rate: float = 0.0, rate_limit: float = 0.0,
+               recordings: Optional[str] = None, upstream: Optional[str] = None, pages: int = 1, match_page: int = 1,
+               seed: Optional[int] = None) -> FastAPI:
+    """
+    Build the mock app. latency is the median delay in seconds (log-normal
+    with sigma `jitter`); error_rate is the share of 500 responses;
+    rate_limit > 0 answers 429 above that many requests per second.
+
+    With upstream set, requests missing from the recordings are proxied there
+    and appended to the recordings file.
+    """
+    app = FastAPI(title="Mock Unwrangle")
+    rng = random.Random(seed)
+    recorded = Recordings(recordings)
+    synthetic = Synthetic(pages=pages, match_page=match_page)
+    throttle = Throttle(rate_limit)
+    stats = {"calls": 0, "search": 0, "detail": 0, "errors": 0, "throttled": 0, "recorded": 0, "proxied": 0}
+    proxy = httpx.AsyncClient(timeout=60) if upstream else None
+
+    @app.get("/api/getter/")
+    async def getter(request: Request):
+        params = dict(request.query_params)
+        platform = params.get("platform", "")
+        stats["calls"] += 1
+        if not throttle.allow():
+            stats["throttled"] += 1
+            return JSONResponse({"success": False, "message": "Rate limit exceeded"}, status_code=429, headers={"Retry-After": "1"})
+        if latency > 0:
+            await asyncio.sleep(latency * rng.lognormvariate(0, jitter) if jitter > 0 else latency)
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"success": False, "message": "Mock upstream error"}, status_code=500)
+        if platform not in ("fergusonhome_search", "fergusonhome_detail"):
+            return JSONResponse({"success": False, "message": f"Unknown platform {platform}"}, status_code=400)
+        stats["search" if platform == "fergusonhome_search" else "detail"] += 1
+        response = recorded.get(platform, params)
+        if response is not None:
+            stats["recorded"] += 1
+            return response
+        if proxy is not None:
+            upstream_response = await proxy.get(upstream, params=params)
+            if upstream_response.status_code == 200 and recordings:
+                recorded.add(platform, params, upstream_response.json())
+            stats["proxied"] += 1
+            return JSONResponse(upstream_response.json(), status_code=upstream_response.status_code)
+        if platform == "fergusonhome_search":
+            return synthetic.search(" ".join(params.get("search", "").split()), int(params.get("page", 1)))
+        return synthetic.detail(urllib.parse.unquote(params.get("url", "")))
+
+    @app.get("/__stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/__reset")
+    async def reset_stats():
+        for key in stats:
+            stats[key] = 0
+        return stats
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Local Unwrangle stand-in for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.3, help="Median response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Log-normal sigma of the delay (0 = constant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests per second before 429 (0 = unlimited)")
+    parser.add_argument("--recordings", help="JSONL file of recorded responses to replay")
+    parser.add_argument("--upstream", help="Proxy unrecorded requests here (e.g. https://data.unwrangle.com/api/getter/) and record them")
+    parser.add_argument("--pages", type=int, default=1, help="Pages per synthetic search")
+    parser.add_argument("--match-page", type=int, default=1, help="Page holding the searched model")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    uvicorn.run(create_app(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_limit=args.rate_limit,
+                           recordings=args.recordings, upstream=args.upstream, pages=args.pages, match_page=args.match_page,
+                           seed=args.seed),
+                host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,200 @@
+"""
+Offline benchmark - drives the API against bench/mock_unwrangle.py and reports latency percentiles, throughput and upstream calls
+
+    python bench/run_bench.py                                  # all scenarios at concurrency 1, 10, 50
+    python bench/run_bench.py --scenarios complete --concurrency 20 --requests 500 --latency 0.1
+    python bench/run_bench.py --compare bench/results/<previous>.json
+
+Both servers run as subprocesses on local ports and the API is restarted for
+every scenario/concurrency pair, so caches start cold each time. Results are
+saved to bench/results/<timestamp>-<git revision>.json.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+API_KEY = "bench"
+
+# Service settings for a benchmark run - the upstream rate limiter is opened up
+# so the numbers measure the service, not the configured Unwrangle rate
+API_ENV = {"UNWRANGLE_API_KEY": "bench", "API_KEY": API_KEY, "LOG_LEVEL": "WARNING", "CACHE_DB_PATH": "", "CATALOG_DB_PATH": "",
+           "UNWRANGLE_RATE": "1000", "UNWRANGLE_MAX_RATE": "1000", "UNWRANGLE_BURST": "1000"}
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+async def wait_ready(url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+def start_process(args: list, env: dict = None) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT_DIR, env={**os.environ, **(env or {})},
+                            stdout=subprocess.DEVNULL)
+
+def stop_process(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def scenario_request(scenario: str, i: int, args) -> tuple:
+    """(path, body, lookups) for request i. Model numbers cycle through a pool of --models, so repeats hit the caches."""
+    model = f"BM-{i % args.models:05d}"
+    if scenario == "complete":
+        return "/lookup-ferguson-complete", {"model_number": model}, 1
+    if scenario == "complete-paged":
+        return "/lookup-ferguson-complete", {"model_number": model, "max_search_pages": args.pages}, 1
+    if scenario == "search":
+        return "/search-ferguson", {"search": model}, 0
+    if scenario == "batch":
+        models = [f"BM-{(i * args.batch_size + j) % args.models:05d}" for j in range(args.batch_size)]
+        return "/lookup-ferguson-batch", {"model_numbers": models}, len(models)
+    raise ValueError(f"Unknown scenario {scenario}")
+
+async def drive(base_url: str, scenario: str, concurrency: int, args) -> dict:
+    """Send --requests requests with `concurrency` workers and collect latencies."""
+    latencies, errors, lookups = [], 0, 0
+    counter = iter(range(args.requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers={"X-API-KEY": API_KEY}, timeout=120, limits=limits) as client:
+        async def worker():
+            nonlocal errors, lookups
+            for i in counter:
+                path, body, count = scenario_request(scenario, i, args)
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=body)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += 0 if ok else 1
+                lookups += count
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"latencies": latencies, "errors": errors, "lookups": lookups, "elapsed": elapsed}
+
+async def run_case(scenario: str, concurrency: int, args, mock_url: str, api_port: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        api = start_process(["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port), "--log-level", "warning"],
+                            {**API_ENV, "UNWRANGLE_BASE_URL": f"{mock_url}/api/getter/", "JOBS_DB_PATH": os.path.join(tmp, "jobs.db"),
+                             "USAGE_DB_PATH": os.path.join(tmp, "usage.db"),
+                             **dict(item.split("=", 1) for item in args.env)})
+        try:
+            base_url = f"http://127.0.0.1:{api_port}"
+            await wait_ready(f"{base_url}/health")
+            async with httpx.AsyncClient() as client:
+                await client.post(f"{mock_url}/__reset")
+                run = await drive(base_url, scenario, concurrency, args)
+                upstream = (await client.get(f"{mock_url}/__stats")).json()
+        finally:
+            stop_process(api)
+    latencies = run["latencies"]
+    return {"scenario": scenario, "concurrency": concurrency, "requests": len(latencies), "errors": run["errors"],
+            "rps": round(len(latencies) / run["elapsed"], 2) if run["elapsed"] else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1), "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1), "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+            "upstream_calls": upstream["calls"],
+            "upstream_calls_per_lookup": round(upstream["calls"] / run["lookups"], 3) if run["lookups"] else None}
+
+def print_table(results: list, baseline: dict = None):
+    columns = ("scenario", "concurrency", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "upstream_calls_per_lookup")
+    print("  ".join(f"{c:>12}" for c in columns))
+    for row in results:
+        cells = [f"{row[c]!s:>12}" for c in columns]
+        print("  ".join(cells))
+        previous = (baseline or {}).get((row["scenario"], row["concurrency"]))
+        if previous:
+            deltas = []
+            for c in columns[4:8]:
+                if previous.get(c):
+                    deltas.append(f"{(row[c] - previous[c]) / previous[c] * 100:+11.1f}%")
+                else:
+                    deltas.append(f"{'-':>12}")
+            print("  ".join([f"{'vs baseline':>12}", *[f"{'':>12}"] * 3, *deltas]))
+
+async def main(args):
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock_args = ["bench/mock_unwrangle.py", "--port", str(args.mock_port), "--latency", str(args.latency),
+                 "--jitter", str(args.jitter), "--error-rate", str(args.error_rate), "--rate-limit", str(args.rate_limit),
+                 "--pages", str(args.pages), "--match-page", str(args.match_page), "--seed", "1"]
+    if args.recordings:
+        mock_args += ["--recordings", args.recordings]
+    mock = start_process(mock_args)
+    results = []
+    try:
+        await wait_ready(f"{mock_url}/__stats")
+        for scenario in args.scenarios.split(","):
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                print(f"running {scenario} at concurrency {concurrency} ...", file=sys.stderr)
+                results.append(await run_case(scenario, concurrency, args, mock_url, args.api_port))
+    finally:
+        stop_process(mock)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(row["scenario"], row["concurrency"]): row for row in json.load(f)["results"]}
+    print_table(results, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        revision = git_revision()
+        path = os.path.join(RESULTS_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{revision}.json")
+        config = {k: v for k, v in vars(args).items() if k not in ("compare", "no_save")}
+        with open(path, "w") as f:
+            json.dump({"revision": revision, "timestamp": datetime.utcnow().isoformat(), "config": config, "results": results}, f, indent=2)
+        print(f"saved {os.path.relpath(path, ROOT_DIR)}", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark against a local Unwrangle stand-in")
+    parser.add_argument("--scenarios", default="complete,search,batch", help="complete, complete-paged, search, batch (comma-separated)")
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and level")
+    parser.add_argument("--models", type=int, default=100, help="Distinct model numbers cycled through (repeats hit the caches)")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock upstream median latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Mock upstream requests per second before 429")
+    parser.add_argument("--pages", type=int, default=1, help="Pages per mock search")
+    parser.add_argument("--match-page", type=int, default=1, help="Mock page holding the searched model (complete-paged)")
+    parser.add_argument("--recordings", help="Recorded responses for the mock to replay")
+    parser.add_argument("--env", action="append", default=[], help="Extra API env var KEY=VALUE (repeatable)")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--api-port", type=int, default=9101)
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,211 @@
+"""Response cache - in-process LRU with an optional SQLite tier that survives restarts"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Detail fields that go stale quickly. They are cached under their own (short) TTL
+# so static specs can outlive them.
+PRICING_FIELDS = (
+    "price", "price_range", "shipping_fee", "variants", "total_inventory_quantity",
+    "has_in_stock_variants", "all_variants_in_stock", "in_stock_variant_count",
+)
+# Pricing fields search results do not carry (see fields.py) - a partial hit would lose them
+DETAIL_ONLY_PRICING_FIELDS = ("price_range", "shipping_fee")
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so 'k-97621-shp ' and 'K-97621-SHP' share a cache entry."""
+    return " ".join(query.split()).upper()
+
+class LRUCache:
+    """Thread-safe in-memory LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+class SQLiteCache:
+    """Disk tier - JSON values keyed by string with an absolute expiry timestamp."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        """Return (value, remaining_ttl) or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        remaining = row[1] - time.time()
+        if remaining <= 0:
+            self.delete(key)
+            return None
+        return json.loads(row[0]), remaining
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               (key, json.dumps(value), time.time() + ttl))
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ResponseCache:
+    """
+    Two-tier cache for Unwrangle search and detail payloads.
+
+    Search results are keyed by normalized query + page and use the pricing TTL
+    (they carry price and stock). Detail results are keyed by variant URL and
+    stored in two parts: static specs under the static TTL, pricing/inventory
+    fields under the pricing TTL.
+
+    The second tier is a SQLite file (db_path) or, when workers share state,
+    the shared backend (see shared.py) - which the cache does not close.
+    Memory hits are answered inline; second-tier reads and writes run in a
+    thread so a busy SQLite file or a Redis round trip never blocks the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1000, pricing_ttl: float = 900, static_ttl: float = 604800,
+                 db_path: Optional[str] = None, shared=None):
+        self.memory = LRUCache(max_entries)
+        self.disk = shared if shared is not None else (SQLiteCache(db_path) if db_path else None)
+        self._owns_disk = shared is None
+        self.pricing_ttl = pricing_ttl
+        self.static_ttl = static_ttl
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "partial_hits": 0, "misses": 0, "credits_saved": 0}
+
+    async def _get(self, key: str):
+        """Return (value, tier) or (None, None)."""
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+        if self.disk is not None:
+            found = await asyncio.to_thread(self.disk.get, key)
+            if found is not None:
+                value, remaining = found
+                self.memory.set(key, value, remaining)  # promote
+                return value, "disk"
+        return None, None
+
+    async def _set(self, key: str, value, ttl: float):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, ttl)
+
+    def _record_hit(self, tier: str, credits: int):
+        self.stats[f"{tier}_hits"] += 1
+        self.stats["credits_saved"] += credits
+
+    async def get_search(self, query: str, page: int = 1, record: bool = True):
+        """Return (data, status) where status is 'memory', 'disk' or 'miss'. record=False leaves the stats alone (polling)."""
+        data, tier = await self._get(f"search:{normalize_query(query)}:{page}")
+        if not record:
+            return data, tier or "miss"
+        if data is None:
+            self.stats["misses"] += 1
+            return None, "miss"
+        self._record_hit(tier, data.get("credits_used", 10))
+        return data, tier
+
+    async def set_search(self, query: str, page: int, data: dict):
+        await self._set(f"search:{normalize_query(query)}:{page}", data, self.pricing_ttl)
+
+    async def get_detail(self, url: str, allow_stale_pricing: bool = False, record: bool = True):
+        """
+        Return (data, status) for a cached detail payload.
+
+        status is 'memory'/'disk' for a full hit, 'partial' when only the static
+        specs are still fresh (pricing fields removed - only returned when
+        allow_stale_pricing is set, so the caller can fill them from search data,
+        and the payload had no detail-only pricing to lose), or 'miss'.
+        record=False leaves the stats alone (polling).
+        """
+        stats = self.stats if record else dict(self.stats)
+        static, tier = await self._get(f"detail:{url}:static")
+        if static is None:
+            stats["misses"] += 1
+            return None, "miss"
+        static = dict(static)
+        partial_ok = static.pop("_partial_ok", False)
+        pricing, _ = await self._get(f"detail:{url}:pricing")
+        if pricing is None:
+            if not allow_stale_pricing or not partial_ok:
+                stats["misses"] += 1
+                return None, "miss"
+            stats["partial_hits"] += 1
+            stats["credits_saved"] += static.get("credits_used", 10)
+            return static, "partial"
+        if record:
+            self._record_hit(tier, static.get("credits_used", 10))
+        static["detail"] = {**static.get("detail", {}), **pricing}
+        return static, tier
+
+    async def set_detail(self, url: str, data: dict):
+        detail = data.get("detail", {}) or {}
+        static = dict(data)
+        static["detail"] = {k: v for k, v in detail.items() if k not in PRICING_FIELDS}
+        pricing = {k: v for k, v in detail.items() if k in PRICING_FIELDS}
+        static["_partial_ok"] = not any(pricing.get(k) for k in DETAIL_ONLY_PRICING_FIELDS)
+        await self._set(f"detail:{url}:static", static, self.static_ttl)
+        await self._set(f"detail:{url}:pricing", pricing, self.pricing_ttl)
+
+    def purge_expired(self) -> int:
+        """Delete expired second-tier entries (otherwise removed only when read again). Returns the number deleted."""
+        return self.disk.purge_expired() if self.disk is not None else 0
+
+    def summary(self) -> dict:
+        return {"memory_entries": len(self.memory), "disk_enabled": self.disk is not None,
+                "pricing_ttl": self.pricing_ttl, "static_ttl": self.static_ttl, **self.stats}
+
+    def close(self):
+        if self.disk is not None and self._owns_disk:
+            self.disk.close()
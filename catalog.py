@@ -0,0 +1,119 @@
+"""Local product catalog - persists merged lookups and serves them without upstream calls"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+from matching import compact_model, normalize_model
+
+class CatalogStore:
+    """
+    SQLite store of merged products built by the complete lookup, one row per
+    variant URL. catalog_keys indexes each row by model number (normalized and
+    separator-free), UPC/barcode, product id, family id and category.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS products (
+                variant_url TEXT PRIMARY KEY, model_number TEXT, brand TEXT COLLATE NOCASE,
+                collection TEXT COLLATE NOCASE, base_category TEXT COLLATE NOCASE,
+                data TEXT NOT NULL, updated_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_products_brand ON products (brand);
+            CREATE INDEX IF NOT EXISTS idx_products_collection ON products (collection);
+            CREATE TABLE IF NOT EXISTS catalog_keys (
+                kind TEXT NOT NULL, value TEXT NOT NULL, variant_url TEXT NOT NULL,
+                PRIMARY KEY (kind, value, variant_url));
+            CREATE INDEX IF NOT EXISTS idx_catalog_keys_url ON catalog_keys (variant_url);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _keys(result: dict) -> set:
+        product = result.get("product", {}) or {}
+        keys = set()
+        for model in (result.get("model_number"), result.get("matched_model"), product.get("model_number")):
+            if model:
+                keys.add(("model", normalize_model(model)))
+                keys.add(("compact", compact_model(model)))
+        for kind, field in (("upc", "upc"), ("upc", "barcode"), ("product_id", "id"), ("family_id", "family_id")):
+            if product.get(field) not in (None, ""):
+                keys.add((kind, str(product[field]).strip().upper()))
+        categories = [c.get("name") for c in product.get("categories", []) or [] if isinstance(c, dict)]
+        for category in categories + [product.get("base_category"), product.get("business_category")]:
+            if category:
+                keys.add(("category", category.strip().upper()))
+        return keys
+
+    def save(self, result: dict):
+        """Store (or replace) a complete lookup result."""
+        variant_url = result.get("variant_url")
+        if not variant_url:
+            return
+        product = result.get("product", {}) or {}
+        with self._lock:
+            # Model keys from earlier lookups of the same variant are kept
+            self._conn.execute("DELETE FROM catalog_keys WHERE variant_url = ? AND kind NOT IN ('model', 'compact')", (variant_url,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (variant_url, model_number, brand, collection, base_category, data, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (variant_url, result.get("matched_model"), product.get("brand"), product.get("collection"),
+                 product.get("base_category"), json.dumps(result), time.time()))
+            self._conn.executemany("INSERT OR IGNORE INTO catalog_keys (kind, value, variant_url) VALUES (?, ?, ?)",
+                                   [(kind, value, variant_url) for kind, value in self._keys(result)])
+            self._conn.commit()
+
+    def lookup_model(self, model_number: str) -> Optional[tuple]:
+        """
+        Find a stored product by its exact normalized model key (the matched or
+        an earlier requested model number). Format variations and the
+        separator-free form are not used: 'K-1234' and '1234' may be different
+        manufacturers' products, so only an upstream search can tell.
+        When several products carry the key, the one whose matched model is
+        the key wins, then the most recently stored.
+        Returns tuple: (result, updated_at) or None
+        """
+        key = normalize_model(model_number)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.model_number, p.data, p.updated_at FROM catalog_keys k JOIN products p ON p.variant_url = k.variant_url "
+                "WHERE k.kind = 'model' AND k.value = ?", (key,)).fetchall()
+        if not rows:
+            return None
+        _, data, updated_at = max(rows, key=lambda row: (bool(row[0]) and normalize_model(row[0]) == key, row[2]))
+        return json.loads(data), updated_at
+
+    def query(self, brand: Optional[str] = None, collection: Optional[str] = None, category: Optional[str] = None,
+              model_number: Optional[str] = None, upc: Optional[str] = None, product_id: Optional[str] = None,
+              family_id: Optional[str] = None, limit: int = 50, offset: int = 0) -> tuple:
+        """Filter stored products. Returns tuple: (total_matches, [(result, updated_at), ...])"""
+        where, params = [], []
+        if brand:
+            where.append("p.brand = ?")
+            params.append(brand.strip())
+        if collection:
+            where.append("p.collection = ?")
+            params.append(collection.strip())
+        for kind, value in (("category", category), ("compact", compact_model(model_number) if model_number else None),
+                            ("upc", upc), ("product_id", product_id), ("family_id", family_id)):
+            if value:
+                where.append("p.variant_url IN (SELECT variant_url FROM catalog_keys WHERE kind = ? AND value = ?)")
+                params.extend([kind, value.strip().upper()])
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM products p {clause}", params).fetchone()[0]
+            rows = self._conn.execute(f"SELECT data, updated_at FROM products p {clause} ORDER BY p.brand, p.model_number LIMIT ? OFFSET ?",
+                                      params + [limit, offset]).fetchall()
+        return total, [(json.loads(data), updated_at) for data, updated_at in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,174 @@
+"""Bulk export - stream complete lookups for a model-number list as NDJSON or flattened CSV"""
+import asyncio
+import csv
+import io
+import json
+import os
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# CSV columns before the flattened product fields
+RESULT_COLUMNS = ("seq", "model_number", "status", "status_code", "error", "matched_model", "match_type",
+                  "match_score", "variant_url", "credits_used")
+
+def parse_model_line(line: str) -> Optional[str]:
+    """Model number from one input line (first CSV column). Blank lines, comments and a header row are skipped."""
+    value = line.split(",", 1)[0].strip().strip('"').strip()
+    if not value or value.startswith("#") or value.lower() in ("model_number", "model"):
+        return None
+    return value
+
+async def iter_models(lines: Iterable[str]) -> AsyncIterator[str]:
+    """Model numbers from input lines, read lazily (an open file is never loaded whole)."""
+    for line in lines:
+        model = parse_model_line(line)
+        if model is not None:
+            yield model
+
+async def ordered_lookups(models: AsyncIterable[str], lookup: Callable[[str], Awaitable[dict]],
+                          concurrency: int = 10, start: int = 0) -> AsyncIterator[tuple]:
+    """
+    Run lookup over models with at most `concurrency` in flight, yielding
+    (seq, model_number, outcome) in input order.
+
+    At most 4 * concurrency items are read ahead, so memory stays bounded
+    however long the input is. The first `start` models are skipped (resume).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    window = deque()
+    iterator = models.__aiter__()
+    exhausted = False
+    seq = 0
+
+    async def run(model: str) -> dict:
+        async with semaphore:
+            try:
+                return await lookup(model)
+            except Exception as e:
+                return {"status": "error", "status_code": 500, "error": f"Export item failed: {str(e)}"}
+
+    try:
+        while True:
+            while not exhausted and len(window) < concurrency * 4:
+                try:
+                    model = await iterator.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                if seq >= start:
+                    window.append((seq, model, asyncio.create_task(run(model))))
+                seq += 1
+            if not window:
+                return
+            item_seq, model, task = window.popleft()
+            yield item_seq, model, await task
+    finally:
+        for _, _, task in window:
+            task.cancel()
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), default=str)
+    return str(value)
+
+class RowFormatter:
+    """Formats outcomes as NDJSON lines or CSV rows with one `product.<field>` column per product field."""
+
+    def __init__(self, fmt: str, product_fields: Iterable[str] = ()):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt!r} - use {' or '.join(FORMATS)}")
+        self.fmt = fmt
+        self.product_fields = tuple(product_fields)
+        self.media_type = FORMATS[fmt]
+
+    def _csv_line(self, values: Iterable) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow([_cell(v) for v in values])
+        return buffer.getvalue()
+
+    def header(self) -> str:
+        if self.fmt != "csv":
+            return ""
+        return self._csv_line(RESULT_COLUMNS + tuple(f"product.{name}" for name in self.product_fields))
+
+    def row(self, seq: int, model_number: str, outcome: dict) -> str:
+        if self.fmt == "ndjson":
+            return json.dumps({"seq": seq, "model_number": model_number, **outcome}, default=str) + "\n"
+        data = outcome.get("data") or {}
+        record = {"seq": seq, "model_number": model_number, **{k: outcome.get(k) for k in ("status", "status_code", "error")},
+                  **{k: data.get(k) for k in RESULT_COLUMNS[5:]}}
+        product = data.get("product") or {}
+        return self._csv_line([record[k] for k in RESULT_COLUMNS] + [product.get(f) for f in self.product_fields])
+
+async def stream_export(models: AsyncIterable[str], lookup: Callable[[str], Awaitable[dict]], formatter: RowFormatter,
+                        concurrency: int = 10, start: int = 0) -> AsyncIterator[str]:
+    """CSV header (unless resuming) followed by one line per model as soon as it is ready."""
+    if start == 0:
+        yield formatter.header()
+    async for seq, model, outcome in ordered_lookups(models, lookup, concurrency, start):
+        yield formatter.row(seq, model, outcome)
+
+class Checkpoint:
+    """
+    Resume state of a file export, saved next to the output as <output>.checkpoint.
+
+    Records how many models are written and the output size at that point;
+    on resume the output is truncated back to that size (dropping rows written
+    after the last checkpoint) and the export continues from there.
+    """
+
+    def __init__(self, output_path: str):
+        self.path = output_path + ".checkpoint"
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, state: dict):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+async def export_to_file(input_path: str, output_path: str, lookup: Callable[[str], Awaitable[dict]], formatter: RowFormatter,
+                         concurrency: int = 10, resume: bool = False, checkpoint_every: int = 50) -> dict:
+    """
+    Export every model in input_path to output_path, checkpointing every
+    checkpoint_every rows. With resume, continues an interrupted export of
+    the same input/format. Returns a summary.
+    """
+    checkpoint = Checkpoint(output_path)
+    state = checkpoint.load() if resume else None
+    if state is not None and (state.get("input") != os.path.abspath(input_path) or state.get("format") != formatter.fmt):
+        raise ValueError(f"{checkpoint.path} belongs to a different export ({state.get('input')}, {state.get('format')})")
+    start, offset = (state["done"], state["offset"]) if state else (0, 0)
+    counts = {"ok": 0, "not_found": 0, "error": 0}
+    credits = 0
+    done = start
+    with open(input_path, encoding="utf-8-sig") as lines, open(output_path, "r+b" if state else "wb") as out:
+        out.truncate(offset)
+        out.seek(offset)
+        if not state:
+            out.write(formatter.header().encode())
+        async for seq, model, outcome in ordered_lookups(iter_models(lines), lookup, concurrency, start):
+            out.write(formatter.row(seq, model, outcome).encode())
+            done = seq + 1
+            status = outcome.get("status", "error")
+            counts[status] = counts.get(status, 0) + 1
+            credits += (outcome.get("data") or {}).get("credits_used", 0)
+            if (done - start) % checkpoint_every == 0:
+                out.flush()
+                checkpoint.save({"input": os.path.abspath(input_path), "format": formatter.fmt, "done": done, "offset": out.tell()})
+    checkpoint.clear()
+    return {"output": output_path, "total": done, "resumed_from": start, "exported": done - start, **counts, "credits_used": credits}
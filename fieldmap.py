@@ -0,0 +1,89 @@
+"""Declarative field maps - merge several upstream payloads into one record from a per-field spec"""
+import ast
+from typing import Any, Iterable, NamedTuple, Optional, Sequence
+
+class Field(NamedTuple):
+    """
+    One output field.
+
+    sources is the priority order; each item is a source name (key = field
+    name) or a (source, key) pair. The first truthy value wins, otherwise the
+    last source's value is used. default replaces a missing key or source and
+    must be a literal (None, [], {}, ...) - it is inlined so every record gets
+    a fresh copy.
+    """
+    name: str
+    group: str
+    sources: tuple
+    default: Any = None
+    doc: str = ""
+
+class FieldMap:
+    """
+    A field spec compiled into plain Python functions.
+
+    The spec is compiled once (at import) into one merge function for all
+    fields plus one per group, equivalent to writing the dict literal by hand:
+
+        {"price": (detail.get("price") if detail is not None else None)
+                  or (search.get("price") if search is not None else None), ...}
+
+    source_names are the merge function's parameters, so the same engine works
+    for any platform's set of payloads (e.g. detail + search for Ferguson).
+    """
+
+    def __init__(self, source_names: Sequence[str], fields: Iterable[Field]):
+        self.source_names = tuple(source_names)
+        if not all(name.isidentifier() for name in self.source_names):
+            raise ValueError(f"Source names must be identifiers: {self.source_names}")
+        self.fields = tuple(self._normalize(f) for f in fields)
+        names = [f.name for f in self.fields]
+        duplicates = {n for n in names if names.count(n) > 1}
+        if duplicates:
+            raise ValueError(f"Duplicate fields: {', '.join(sorted(duplicates))}")
+        self.groups = tuple(dict.fromkeys(f.group for f in self.fields))
+        self.group_fields = {g: tuple(f.name for f in self.fields if f.group == g) for g in self.groups}
+        self._merge_all = self._compile(self.fields)
+        self._merge_group = {g: self._compile([f for f in self.fields if f.group == g]) for g in self.groups}
+
+    def _normalize(self, f: Field) -> Field:
+        sources = tuple((s, f.name) if isinstance(s, str) else tuple(s) for s in f.sources)
+        if not sources:
+            raise ValueError(f"Field {f.name!r} has no sources")
+        for source, _ in sources:
+            if source not in self.source_names:
+                raise ValueError(f"Field {f.name!r}: unknown source {source!r}")
+        try:
+            literal = ast.literal_eval(repr(f.default)) == f.default
+        except (ValueError, SyntaxError):
+            literal = False
+        if not literal:
+            raise ValueError(f"Field {f.name!r}: default must be a literal")
+        return f._replace(sources=sources)
+
+    def _compile(self, fields: Sequence[Field]):
+        items = []
+        for f in fields:
+            default = repr(f.default)
+            reads = [f"({source}.get({key!r}, {default}) if {source} is not None else {default})" for source, key in f.sources]
+            items.append(f"{f.name!r}: {' or '.join(reads)}")
+        code = f"def merge({', '.join(self.source_names)}):\n    return {{{', '.join(items)}}}\n"
+        namespace = {}
+        exec(compile(code, "<fieldmap>", "exec"), namespace)
+        return namespace["merge"]
+
+    def merge(self, *sources: Optional[dict], groups: Optional[Iterable[str]] = None) -> dict:
+        """Merge the source payloads (in source_names order). groups limits the output (None = all)."""
+        if groups is None:
+            return self._merge_all(*sources)
+        record = {}
+        for group in self.groups:
+            if group in groups:
+                record.update(self._merge_group[group](*sources))
+        return record
+
+    def schema(self) -> dict:
+        """Field documentation by group, in output order."""
+        return {group: [{"name": f.name, "sources": [f"{s}.{k}" for s, k in f.sources], "default": f.default, "doc": f.doc}
+                        for f in self.fields if f.group == group]
+                for group in self.groups}
@@ -0,0 +1,155 @@
+"""Product field map - the declarative search/detail merge spec for Ferguson and its projection"""
+from typing import Iterable, Optional
+from fieldmap import Field, FieldMap
+
+D, S = "detail", "search"  # fergusonhome_detail / the matched fergusonhome_search product
+
+PRODUCT_FIELDS = FieldMap((D, S), [
+    # ========== BASIC INFORMATION ==========
+    Field("id", "basic", (D, S)),
+    Field("family_id", "basic", (S,)),
+    Field("name", "basic", (D, S)),
+    Field("brand", "basic", (D, S)),
+    Field("brand_url", "basic", (D,)),
+    Field("brand_logo", "basic", (D,)),
+    Field("model_number", "basic", (D,)),
+    Field("url", "basic", (D,)),
+    Field("product_type", "basic", (D,)),
+    Field("application", "basic", (D,)),
+    Field("collection", "basic", (D, S)),
+    Field("description", "basic", (D,)),
+    Field("is_discontinued", "basic", (D,)),
+
+    # ========== PRICING ==========
+    Field("price", "pricing", (D, S)),
+    Field("price_min", "pricing", (S,)),
+    Field("price_max", "pricing", (S,)),
+    Field("unit_price", "pricing", (S,)),
+    Field("price_type", "pricing", (S,)),
+    Field("price_range", "pricing", (D,), default={}),
+    Field("currency", "pricing", (D, S)),
+    Field("base_type", "pricing", (D,)),
+    Field("shipping_fee", "pricing", (D,)),
+    Field("has_free_installation", "pricing", (D,)),
+
+    # ========== INVENTORY & VARIANTS ==========
+    Field("variants", "inventory", (D, S), default=[]),
+    Field("variant_count", "inventory", (D, S)),
+    Field("has_variant_groups", "inventory", (D,)),
+    Field("has_in_stock_variants", "inventory", (D, S)),
+    Field("all_variants_in_stock", "inventory", (D, S)),
+    Field("all_variants_restricted", "inventory", (S,)),
+    Field("total_inventory_quantity", "inventory", (D, S)),
+    Field("in_stock_variant_count", "inventory", (D, S)),
+    Field("is_configurable", "inventory", (D, S)),
+    Field("is_square_footage_based", "inventory", (S,)),
+    Field("configuration_type", "inventory", (D,)),
+
+    # ========== IMAGES & VIDEOS ==========
+    Field("images", "media", (D, S), default=[]),
+    Field("thumbnail", "media", (D, S)),
+    Field("videos", "media", (D,), default=[]),
+
+    # ========== SPECIFICATIONS, COMPLIANCE & WARRANTY ==========
+    Field("specifications", "specs", (D,), default={}),
+    Field("feature_groups", "specs", (D,), default=[]),
+    Field("dimensions", "specs", (D,), default={}),
+    Field("attribute_ids", "specs", (D,), default=[]),
+    Field("certifications", "specs", (D,), default=[]),
+    Field("country_of_origin", "specs", (D,)),
+    Field("warranty", "specs", (D,)),
+    Field("manufacturer_warranty", "specs", (D,)),
+
+    # ========== IDENTIFIERS ==========
+    Field("upc", "identifiers", (D,)),
+    Field("barcode", "identifiers", (D,)),
+
+    # ========== RESOURCES & DOCUMENTATION ==========
+    Field("resources", "resources", (D,), default=[]),
+
+    # ========== CATEGORIES ==========
+    Field("categories", "categories", (D,), default=[]),
+    Field("base_category", "categories", (D,)),
+    Field("business_category", "categories", (D,)),
+    Field("related_categories", "categories", (D,), default=[]),
+
+    # ========== REVIEWS & RATINGS ==========
+    Field("rating", "reviews", (D, S)),
+    Field("total_ratings", "reviews", (S,), doc="Same count as total_reviews"),
+    Field("review_count", "reviews", (D,)),
+    Field("total_reviews", "reviews", (D, (S, "total_ratings"))),
+    Field("questions_count", "reviews", (D,)),
+
+    # ========== SHIPPING INFO ==========
+    Field("is_quick_ship", "shipping", (S,)),
+    Field("shipping_info", "shipping", (S,), doc="Search shipping summary (differs from detail)"),
+
+    # ========== SPECIAL FLAGS ==========
+    Field("is_appointment_only_brand", "flags", (S,)),
+    Field("is_by_appointment_only", "flags", (D,)),
+
+    # ========== RELATED PRODUCTS & OPTIONS ==========
+    Field("has_recommended_options", "related", (D,)),
+    Field("recommended_options", "related", (D,), default=[]),
+    Field("has_accessories", "related", (D,)),
+    Field("has_replacement_parts", "related", (D,)),
+    Field("replacement_parts_url", "related", (D,)),
+])
+
+# Group names in response order
+FIELD_GROUPS = PRODUCT_FIELDS.groups
+GROUP_FIELDS = PRODUCT_FIELDS.group_fields
+
+# Response sections outside `product` that are only sent when asked for (or with all groups)
+OPTIONAL_SECTIONS = {"search_meta": "search_meta_data"}
+
+def parse_fields(fields: Optional[Iterable[str]]) -> Optional[set]:
+    """Validate requested group names. None (or 'all') means every group."""
+    if not fields:
+        return None
+    requested = {f.strip().lower() for f in fields if f.strip()}
+    if not requested or "all" in requested:
+        return None
+    unknown = requested - set(FIELD_GROUPS) - set(OPTIONAL_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown field group(s): {', '.join(sorted(unknown))}. "
+                         f"Valid: all, {', '.join(list(FIELD_GROUPS) + list(OPTIONAL_SECTIONS))}")
+    return requested
+
+def selected_fields(groups: Optional[set] = None) -> tuple:
+    """Product field names of the requested groups in response order (None = all)."""
+    return tuple(name for group in FIELD_GROUPS if groups is None or group in groups for name in GROUP_FIELDS[group])
+
+def build_product(product_detail: dict, search_product_data: Optional[dict], groups: Optional[set] = None) -> dict:
+    """Merge detail and search data for the requested groups only (None = all)."""
+    return PRODUCT_FIELDS.merge(product_detail, search_product_data, groups=groups)
+
+def schema() -> dict:
+    """Product fields by group with their sources - served by /fields."""
+    return {"groups": PRODUCT_FIELDS.schema(), "optional_sections": OPTIONAL_SECTIONS}
+
+def drop_nulls(value):
+    """Recursively remove None values from dicts (lists keep their length)."""
+    if isinstance(value, dict):
+        return {k: drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_nulls(v) for v in value]
+    return value
+
+def project_result(result: dict, groups: Optional[set] = None, compact: bool = False) -> dict:
+    """
+    Apply a field projection to a complete lookup result built with all groups
+    (e.g. one served from the catalog). Returns a new dict.
+    """
+    if groups is None and not compact:
+        return result
+    projected = dict(result)
+    if groups is not None:
+        names = {field for name in groups if name in GROUP_FIELDS for field in GROUP_FIELDS[name]}
+        projected["product"] = {k: v for k, v in result.get("product", {}).items() if k in names}
+        for group, key in OPTIONAL_SECTIONS.items():
+            if group not in groups:
+                projected.pop(key, None)
+    if compact:
+        projected["product"] = drop_nulls(projected.get("product", {}))
+    return projected
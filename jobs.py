@@ -0,0 +1,234 @@
+"""Background enrichment jobs - SQLite-backed queue processed by an asyncio worker pool"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+FINISHED_STATUSES = ("ok", "not_found", "error")
+
+class JobStore:
+    """Persists jobs, their items and finished results so a restart can resume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL,
+                created_at REAL NOT NULL, updated_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL, seq INTEGER NOT NULL, model_number TEXT NOT NULL,
+                status TEXT NOT NULL, credits_used INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (job_id, seq));
+            CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (job_id, status);
+            CREATE TABLE IF NOT EXISTS job_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, seq INTEGER NOT NULL,
+                result TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_job_results_job ON job_results (job_id, id);
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(job_items)")]
+        if "claimed_by" not in columns:  # job stores created before items were claimed
+            self._conn.execute("ALTER TABLE job_items ADD COLUMN claimed_by TEXT")
+        if "client" not in [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]:  # ... or recorded their client
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN client TEXT")
+        self._conn.commit()
+
+    def create_job(self, model_numbers: list, client: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT INTO jobs (id, status, total, created_at, updated_at, client) VALUES (?, 'running', ?, ?, ?, ?)",
+                               (job_id, len(model_numbers), now, now, client))
+            self._conn.executemany("INSERT INTO job_items (job_id, seq, model_number, status) VALUES (?, ?, ?, 'pending')",
+                                   [(job_id, seq, model) for seq, model in enumerate(model_numbers)])
+            self._conn.commit()
+        return job_id
+
+    def reset_orphans(self, is_alive: Callable[[str], bool]) -> list:
+        """Reset items left 'running' by workers that are no longer alive (crash, restart). Returns the reset items."""
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT claimed_by FROM job_items WHERE status = 'running'").fetchall()]
+            reset = []
+            for owner in owners:
+                if owner is None or not is_alive(owner):
+                    reset += self._conn.execute("SELECT job_id, seq, model_number FROM job_items "
+                                                "WHERE status = 'running' AND claimed_by IS ?", (owner,)).fetchall()
+                    self._conn.execute("UPDATE job_items SET status = 'pending', claimed_by = NULL "
+                                       "WHERE status = 'running' AND claimed_by IS ?", (owner,))
+            self._conn.commit()
+            return reset
+
+    def pending_items(self, is_alive: Callable[[str], bool] = lambda owner: False) -> list:
+        """Unfinished items of all jobs, oldest job first, after resetting orphaned running items."""
+        self.reset_orphans(is_alive)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT i.job_id, i.seq, i.model_number FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                "WHERE i.status = 'pending' ORDER BY j.created_at, i.seq").fetchall()
+
+    def claim_item(self, job_id: str, seq: int, owner: str) -> bool:
+        """Mark a pending item running for owner. False if another worker claimed or finished it first."""
+        with self._lock:
+            cursor = self._conn.execute("UPDATE job_items SET status = 'running', claimed_by = ? "
+                                        "WHERE job_id = ? AND seq = ? AND status = 'pending'", (owner, job_id, seq))
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def finish_item(self, job_id: str, seq: int, outcome: dict):
+        credits = outcome.get("data", {}).get("credits_used", 0) if outcome["status"] == "ok" else 0
+        with self._lock:
+            self._conn.execute("UPDATE job_items SET status = ?, credits_used = ? WHERE job_id = ? AND seq = ?",
+                               (outcome["status"], credits, job_id, seq))
+            self._conn.execute("INSERT INTO job_results (job_id, seq, result) VALUES (?, ?, ?)",
+                               (job_id, seq, json.dumps(outcome)))
+            remaining = self._conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status IN ('pending', 'running')", (job_id,)).fetchone()[0]
+            self._conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                               ("completed" if remaining == 0 else "running", time.time(), job_id))
+            self._conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT status, total, created_at, updated_at, client FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+            credits = self._conn.execute("SELECT COALESCE(SUM(credits_used), 0) FROM job_items WHERE job_id = ?",
+                                         (job_id,)).fetchone()[0]
+        finished = sum(counts.get(s, 0) for s in FINISHED_STATUSES)
+        return {"job_id": job_id, "status": row[0], "total": row[1], "finished": finished,
+                "pending": counts.get("pending", 0), "running": counts.get("running", 0),
+                "succeeded": counts.get("ok", 0), "not_found": counts.get("not_found", 0), "errors": counts.get("error", 0),
+                "progress": round(finished / row[1], 4) if row[1] else 1.0, "credits_used": credits,
+                "client": row[4], "created_at": row[2], "updated_at": row[3]}
+
+    def job_client(self, job_id: str) -> Optional[str]:
+        """Name of the client that submitted the job (None for jobs without one)."""
+        with self._lock:
+            row = self._conn.execute("SELECT client FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def results_after(self, job_id: str, after_id: int, limit: int = 500) -> list:
+        """Finished results in completion order, as (result_id, seq, result_json) rows."""
+        with self._lock:
+            return self._conn.execute("SELECT id, seq, result FROM job_results WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+                                      (job_id, after_id, limit)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JobManager:
+    """
+    Runs job items on a fixed pool of asyncio workers.
+
+    `lookup` takes a model number and the name of the client that submitted
+    the job, and returns an outcome dict with a `status` key ('ok',
+    'not_found' or 'error'); it must not raise.
+    
+    Several processes may share one job store: items are claimed atomically
+    before they run, and each manager keeps a heartbeat lease in `backend`
+    (see shared.py) so a starting manager only resumes items whose owner is
+    gone. Running managers periodically queue every unfinished item, which
+    picks up those a dead manager had queued or was running.
+    """
+
+    HEARTBEAT = 10.0
+    ORPHAN_SCAN_EVERY = 6  # heartbeats
+
+    def __init__(self, store: JobStore, lookup: Callable[[str, Optional[str]], Awaitable[dict]], workers: int = 4, backend=None):
+        self.store = store
+        self.lookup = lookup
+        self.worker_count = workers
+        self.backend = backend
+        self.owner = uuid.uuid4().hex
+        self._clients = {}  # job id -> submitting client
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._queued = set()  # (job id, seq) of the items in _queue
+        self._workers = []
+
+    def _enqueue(self, item: tuple):
+        job_id, seq, _ = item
+        if (job_id, seq) not in self._queued:
+            self._queued.add((job_id, seq))
+            self._queue.put_nowait(tuple(item))
+
+    def _is_alive(self, owner: str) -> bool:
+        return self.backend is not None and self.backend.get(f"jobs:owner:{owner}") is not None
+
+    async def _heartbeat(self):
+        beats = 0
+        while True:
+            self.backend.set(f"jobs:owner:{self.owner}", time.time(), ttl=self.HEARTBEAT * 3)
+            beats += 1
+            if beats % self.ORPHAN_SCAN_EVERY == 0:
+                # Take over items of workers that died while other workers kept running: the ones they
+                # were running and the ones still waiting in their queues (claiming makes duplicates harmless)
+                for item in self.store.pending_items(self._is_alive):
+                    self._enqueue(item)
+            await asyncio.sleep(self.HEARTBEAT)
+
+    async def start(self):
+        if self.backend is not None:
+            self._workers.append(asyncio.create_task(self._heartbeat()))
+        for item in self.store.pending_items(self._is_alive):
+            self._enqueue(item)
+        self._workers += [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.backend is not None:
+            self.backend.delete(f"jobs:owner:{self.owner}")  # lets the next manager resume our items right away
+
+    def submit(self, model_numbers: list, client: Optional[str] = None) -> str:
+        job_id = self.store.create_job(model_numbers, client)
+        self._clients[job_id] = client
+        for seq, model in enumerate(model_numbers):
+            self._enqueue((job_id, seq, model))
+        return job_id
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    async def _worker(self):
+        while True:
+            job_id, seq, model = await self._queue.get()
+            self._queued.discard((job_id, seq))
+            try:
+                if not self.store.claim_item(job_id, seq, self.owner):
+                    continue  # taken by another worker
+                if job_id not in self._clients:
+                    self._clients[job_id] = self.store.job_client(job_id)
+                outcome = await self.lookup(model, self._clients[job_id])
+                # A cancelled lookup leaves the item 'running' - it is reset to pending on restart
+                self.store.finish_item(job_id, seq, {"seq": seq, "model_number": model, **outcome})
+            except Exception as e:
+                self.store.finish_item(job_id, seq, {"seq": seq, "model_number": model, "status": "error",
+                                                     "status_code": 500, "error": f"Job item failed: {str(e)}"})
+            finally:
+                self._queue.task_done()
+
+    async def stream_results(self, job_id: str, poll_interval: float = 1.0) -> AsyncIterator[str]:
+        """Yield finished results as NDJSON lines until the job is complete."""
+        last_id = 0
+        while True:
+            job = self.store.get_job(job_id)
+            rows = self.store.results_after(job_id, last_id)
+            for result_id, _, result in rows:
+                last_id = result_id
+                yield result + "\n"
+            if not rows:
+                if job is None or job["status"] == "completed":
+                    return
+                await asyncio.sleep(poll_interval)
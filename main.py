@@ -1,106 +1,355 @@
 """Ferguson API - Standalone Service"""
+import asyncio
+import io
+import json
+import logging
+import math
 import os
+import sys
+import tempfile
 import time
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
 from datetime import datetime
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Header
+from typing import AsyncIterator, Callable, List, Optional
+from fastapi import FastAPI, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
-import requests
+import httpx
+from unwrangle import UNWRANGLE_URL, UnwrangleClient
+from resilience import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError, SharedRateLimiter
+from cache import ResponseCache, normalize_query
+from jobs import JobManager, JobStore
+from singleflight import SingleFlight
+from shared import CreditCounter, SharedFlight, create_backend
+from quotas import Client, CreditLimitError, QuotaExceededError, QuotaManager, RequestCredits, current_credits, parse_clients
+from matching import VariantIndex, rank_model_variations
+from catalog import CatalogStore
+from refresh import RefreshScheduler
+from fields import FIELD_GROUPS, build_product, parse_fields, project_result, schema as product_schema, selected_fields
+from export import RowFormatter, export_to_file, iter_models, stream_export
+from metrics import (REGISTRY, CACHE_REQUESTS, CLIENT_CREDITS, CREDITS_SPENT, Gauge, HTTP_IN_FLIGHT, HTTP_REQUEST_DURATION, HTTP_REQUESTS,
+                     MATCH_TYPES, STAGE_DURATION)
 
 load_dotenv()
 UNWRANGLE_API_KEY = os.getenv("UNWRANGLE_API_KEY")
+UNWRANGLE_BASE_URL = os.getenv("UNWRANGLE_BASE_URL", UNWRANGLE_URL)  # point at bench/mock_unwrangle.py for offline runs
 API_KEY = os.getenv("API_KEY", "catbot123")
+# One key per client with an optional credit quota: comma-separated name:key[:quota] - replaces API_KEY when set
+API_KEYS = os.getenv("API_KEYS", "")
+CREDIT_QUOTA_PERIOD = os.getenv("CREDIT_QUOTA_PERIOD", "month")  # quotas reset every UTC day or month
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", "usage.db")
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", 10))
 PORT = int(os.getenv("PORT", 8000))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+UNWRANGLE_MAX_CONNECTIONS = int(os.getenv("UNWRANGLE_MAX_CONNECTIONS", 50))
+UNWRANGLE_MAX_KEEPALIVE = int(os.getenv("UNWRANGLE_MAX_KEEPALIVE", 20))
+UNWRANGLE_CONNECT_TIMEOUT = float(os.getenv("UNWRANGLE_CONNECT_TIMEOUT", 5))
+UNWRANGLE_READ_TIMEOUT = float(os.getenv("UNWRANGLE_READ_TIMEOUT", 45))
+UNWRANGLE_RATE = float(os.getenv("UNWRANGLE_RATE", 5))
+UNWRANGLE_MIN_RATE = float(os.getenv("UNWRANGLE_MIN_RATE", 0.5))
+UNWRANGLE_MAX_RATE = float(os.getenv("UNWRANGLE_MAX_RATE", 20))
+UNWRANGLE_BURST = int(os.getenv("UNWRANGLE_BURST", 10))
+UNWRANGLE_TARGET_LATENCY = float(os.getenv("UNWRANGLE_TARGET_LATENCY", 20))
+UNWRANGLE_MAX_RETRIES = int(os.getenv("UNWRANGLE_MAX_RETRIES", 2))
+UNWRANGLE_RETRY_DEADLINE = float(os.getenv("UNWRANGLE_RETRY_DEADLINE", 60))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", 30))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1000))
+CACHE_PRICING_TTL = float(os.getenv("CACHE_PRICING_TTL", 900))
+CACHE_STATIC_TTL = float(os.getenv("CACHE_STATIC_TTL", 604800))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "")
+CACHE_PURGE_INTERVAL = float(os.getenv("CACHE_PURGE_INTERVAL", 3600))
+VARIATION_MAX_SEARCHES = int(os.getenv("VARIATION_MAX_SEARCHES", 4))
+SEARCH_MAX_PAGES = int(os.getenv("SEARCH_MAX_PAGES", 10))
+SEARCH_PAGE_CONCURRENCY = int(os.getenv("SEARCH_PAGE_CONCURRENCY", 3))
+LOOKUP_MAX_PAGES = int(os.getenv("LOOKUP_MAX_PAGES", 1))
+LOOKUP_RESERVE = 10 * LOOKUP_MAX_PAGES + 10  # worst-case credits of a default complete lookup (every page + detail)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 500))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 10))
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", 10))
+EXPORT_SPOOL_BYTES = 1024 * 1024  # uploaded model lists larger than this are spooled to disk
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "catalog.db")
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", 86400))
+CATALOG_STALE_MAX_AGE = float(os.getenv("CATALOG_STALE_MAX_AGE", 604800))
+REFRESH_CREDITS_PER_MINUTE = int(os.getenv("REFRESH_CREDITS_PER_MINUTE", 200))
+REFRESH_AHEAD = float(os.getenv("REFRESH_AHEAD", 0.8))
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", 2))
+REFRESH_SCAN_INTERVAL = float(os.getenv("REFRESH_SCAN_INTERVAL", 60))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_ITEMS = int(os.getenv("JOB_MAX_ITEMS", 10000))
+WORKERS = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", 1)))
+# State shared by worker processes: local (one worker), sqlite:///<file> (one host) or redis://<host> (many hosts)
+SHARED_BACKEND = os.getenv("SHARED_BACKEND", "sqlite:///shared.db" if WORKERS > 1 else "local")
 
-app = FastAPI(title="Ferguson API", version="1.0.0")
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger("ferguson_api")
+logging.getLogger("httpx").setLevel(logging.WARNING)  # its request logs include the Unwrangle api_key
+
+shared_backend = create_backend(SHARED_BACKEND)
+limiter_settings = dict(rate=UNWRANGLE_RATE, min_rate=UNWRANGLE_MIN_RATE, max_rate=UNWRANGLE_MAX_RATE,
+                        burst=UNWRANGLE_BURST, target_latency=UNWRANGLE_TARGET_LATENCY)
+unwrangle = UnwrangleClient(UNWRANGLE_API_KEY, base_url=UNWRANGLE_BASE_URL, max_connections=UNWRANGLE_MAX_CONNECTIONS, max_keepalive=UNWRANGLE_MAX_KEEPALIVE,
+                            connect_timeout=UNWRANGLE_CONNECT_TIMEOUT, read_timeout=UNWRANGLE_READ_TIMEOUT,
+                            limiter=SharedRateLimiter(shared_backend, **limiter_settings) if shared_backend.shared
+                            else AdaptiveRateLimiter(**limiter_settings),
+                            breaker=CircuitBreaker(failure_threshold=BREAKER_FAILURE_THRESHOLD, recovery_timeout=BREAKER_RECOVERY_TIMEOUT),
+                            max_retries=UNWRANGLE_MAX_RETRIES, retry_deadline=UNWRANGLE_RETRY_DEADLINE)
+response_cache = ResponseCache(max_entries=CACHE_MAX_ENTRIES, pricing_ttl=CACHE_PRICING_TTL, static_ttl=CACHE_STATIC_TTL,
+                               db_path=CACHE_DB_PATH or None, shared=shared_backend if shared_backend.shared else None)
+inflight = SingleFlight()
+# Cross-worker dedup of upstream calls - a lease outlives the longest call including retries
+shared_flight = SharedFlight(shared_backend, lease=UNWRANGLE_RETRY_DEADLINE + UNWRANGLE_READ_TIMEOUT)
+credit_counter = CreditCounter(shared_backend)
+# Per-client usage lives in the shared backend, or in its own SQLite file when there is none
+usage_backend = shared_backend if shared_backend.shared or not USAGE_DB_PATH else create_backend(f"sqlite:///{USAGE_DB_PATH}")
+quotas = QuotaManager(parse_clients(API_KEYS) if API_KEYS else [Client("default", API_KEY)], usage_backend,
+                      period=CREDIT_QUOTA_PERIOD, flush_interval=USAGE_FLUSH_INTERVAL)
+catalog = CatalogStore(CATALOG_DB_PATH) if CATALOG_DB_PATH else None
+# Stale-while-revalidate for catalog products (needs the catalog and a non-zero credit budget)
+refresher = RefreshScheduler(lambda model_number: refresh_product(model_number), max_age=CATALOG_MAX_AGE,
+                             credits_per_minute=REFRESH_CREDITS_PER_MINUTE, refresh_ahead=REFRESH_AHEAD,
+                             workers=REFRESH_WORKERS, scan_interval=REFRESH_SCAN_INTERVAL, backend=shared_backend) \
+    if catalog is not None and REFRESH_CREDITS_PER_MINUTE > 0 else None
+
+async def purge_expired():
+    """Every CACHE_PURGE_INTERVAL seconds, delete expired rows of the SQLite cache tier / shared backend and the usage file."""
+    stores = [response_cache] + ([usage_backend] if usage_backend is not shared_backend else [])
+    while True:
+        for store in stores:
+            try:
+                purged = await asyncio.to_thread(store.purge_expired)
+                logger.debug("cache.purged store=%s rows=%d", type(store).__name__, purged)
+            except Exception as e:
+                logger.warning("cache.purge_failed store=%s error=%s", type(store).__name__, e)
+        await asyncio.sleep(CACHE_PURGE_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await unwrangle.start()
+    await quotas.start()
+    job_manager = JobManager(JobStore(JOBS_DB_PATH), job_lookup, workers=JOB_WORKERS, backend=shared_backend)
+    await job_manager.start()  # resumes items left unfinished by a previous run
+    app.state.jobs = job_manager
+    if refresher is not None:
+        await refresher.start()
+    purger = asyncio.create_task(purge_expired())
+    yield
+    purger.cancel()
+    await asyncio.gather(purger, return_exceptions=True)
+    if refresher is not None:
+        await refresher.stop()
+    await job_manager.stop()
+    job_manager.store.close()
+    await quotas.stop()  # persists usage not flushed yet
+    await unwrangle.close()
+    await credit_counter.wait()
+    response_cache.close()
+    if catalog is not None:
+        catalog.close()
+    if usage_backend is not shared_backend:
+        usage_backend.close()
+    shared_backend.close()
+
+try:
+    import orjson  # noqa: F401 - ORJSONResponse needs it; serializes large product bodies several times faster
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    DefaultResponse = JSONResponse
+
+app = FastAPI(title="Ferguson API", version="1.0.0", lifespan=lifespan, default_response_class=DefaultResponse)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+
+# Point-in-time state, read when /metrics is scraped
+REGISTRY.register(Gauge("ferguson_circuit_breaker_open", "1 while the Unwrangle circuit breaker is open or half-open",
+                        function=lambda: 0 if unwrangle.breaker.state == "closed" else 1))
+REGISTRY.register(Gauge("ferguson_rate_limit_per_second", "Current adaptive Unwrangle request rate",
+                        function=lambda: unwrangle.limiter.rate))
+REGISTRY.register(Gauge("ferguson_cache_entries", "Entries in the in-memory response cache",
+                        function=lambda: len(response_cache.memory)))
+REGISTRY.register(Gauge("ferguson_inflight_upstream_keys", "Distinct search/detail keys with an upstream call in flight",
+                        function=lambda: inflight.summary()["in_flight"]))
+
 class FergusonSearchRequest(BaseModel):
     search: str = Field(..., description="Search query")
     page: int = Field(1, ge=1)
+    all_pages: bool = Field(False, description="Also fetch the following pages concurrently and merge their products")
+    max_pages: int = Field(SEARCH_MAX_PAGES, ge=1, le=50, description="Max pages to fetch with all_pages (including `page`)")
+    credit_budget: Optional[int] = Field(None, ge=0, description="Credits the search may spend - caps pages (10 credits each, 402 if not even the first fits)")
+    stream: bool = Field(False, description="With all_pages, stream one NDJSON line per page instead of merging")
 
 class FergusonProductRequest(BaseModel):
     url: str = Field(..., description="Ferguson product URL")
 
 class FergusonCompleteLookupRequest(BaseModel):
     model_number: str = Field(..., description="Manufacturer model number")
+    resolve_variations: bool = Field(False, description="If the model number finds no exact/variation match, search ranked format variations in parallel")
+    max_variation_searches: int = Field(VARIATION_MAX_SEARCHES, ge=1, le=8, description="Max variation searches to run")
+    max_search_pages: int = Field(LOOKUP_MAX_PAGES, ge=1, le=20, description="Search pages to scan in order until the variant matches (10 credits per extra page)")
+    credit_budget: Optional[int] = Field(None, ge=0, description="Credits this lookup may spend - its worst case (10 per page and variation search, plus 10 for the detail) is reserved up front, cut to what is left; 402 if not even search + detail (20) fit")
+    max_catalog_age: Optional[float] = Field(None, ge=0, description=f"Serve from the local catalog if stored within this many seconds (default {CATALOG_MAX_AGE:.0f}, 0 = always fetch)")
+    fields: Optional[List[str]] = Field(None, description=f"Product field groups to return: {', '.join(FIELD_GROUPS)}, search_meta (default all)")
+    compact: bool = Field(False, description="Leave null values out of the product")
+    
+    @field_validator("fields")
+    @classmethod
+    def check_fields(cls, value):
+        parse_fields(value)
+        return value
+
+class FergusonJobRequest(BaseModel):
+    model_numbers: List[str] = Field(..., min_length=1, max_length=JOB_MAX_ITEMS, description="Manufacturer model numbers")
+
+class FergusonBatchLookupRequest(BaseModel):
+    model_numbers: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS, description="Manufacturer model numbers")
+    concurrency: Optional[int] = Field(None, ge=1, le=50, description=f"Parallel lookups (default {BATCH_CONCURRENCY})")
+    fields: Optional[List[str]] = Field(None, description=f"Product field groups to return: {', '.join(FIELD_GROUPS)}, search_meta (default all)")
+    compact: bool = Field(False, description="Leave null values out of each product")
+    credit_budget: Optional[int] = Field(None, ge=0, description="Credits the whole batch may spend - items that no longer fit fail with 402")
+    
+    @field_validator("fields")
+    @classmethod
+    def check_fields(cls, value):
+        parse_fields(value)
+        return value
 
-def generate_model_variations(model_number: str) -> list:
+async def fetch_search(query: str, page: int = 1) -> tuple:
     """
-    Generate common model number format variations for smart matching.
-    Returns list of possible variations to try.
+    Search Ferguson through the response cache. Concurrent misses for the same
+    normalized query/page share one upstream call.
+    Returns tuple: (search_data, cache_status, credits_spent)
     """
-    model = model_number.strip()
-    variations = [model]  # Original
+    data, status = await response_cache.get_search(query, page)
+    if data is not None:
+        CACHE_REQUESTS.inc(kind="search", result=status)
+        return data, status, 0
     
-    # Common brand prefixes
-    prefixes = ["K-", "G-", "M-", "A-"]
-    for prefix in prefixes:
-        if not model.upper().startswith(prefix.upper()):
-            variations.append(f"{prefix}{model}")
+    async def call():
+        result = await unwrangle.search(query, page)
+        if result.get("success"):
+            await response_cache.set_search(query, page, result)
+        return result
     
-    # Add/remove hyphens
-    if "-" in model:
-        variations.append(model.replace("-", ""))  # Remove all hyphens
-    else:
-        # Try adding hyphens in common positions
-        if len(model) > 4:
-            # Format: G9104BNI -> G-9104-BNI
-            if model[0].isalpha() and model[1:5].isdigit():
-                variations.append(f"{model[0]}-{model[1:5]}-{model[5:]}")
-            # Format: 97621SHP -> 97621-SHP
-            for i in range(2, len(model)-1):
-                if model[i].isalpha() and model[i-1].isdigit():
-                    variations.append(f"{model[:i]}-{model[i:]}")
-                    break
+    async def cached():
+        return (await response_cache.get_search(query, page, record=False))[0]
+    
+    async def upstream():
+        # Another worker may be fetching the same page - wait for it in the shared cache
+        return await shared_flight.do(f"search:{normalize_query(query)}:{page}", call, cached)
+    
+    (data, remote), shared = await inflight.do(("search", normalize_query(query), page), upstream)
+    if shared or remote:
+        CACHE_REQUESTS.inc(kind="search", result="coalesced")
+        return data, "coalesced", 0
+    CACHE_REQUESTS.inc(kind="search", result="miss")
+    spend_credits("fergusonhome_search", data.get("credits_used", 10))
+    return data, "miss", data.get("credits_used", 10)
+
+async def fetch_detail(url: str, allow_stale_pricing: bool = False) -> tuple:
+    """
+    Fetch Ferguson product detail through the response cache. Concurrent misses
+    for the same variant URL share one upstream call.
+    With allow_stale_pricing a 'partial' hit (static specs only) may be returned.
+    Returns tuple: (detail_data, cache_status, credits_spent)
+    """
+    data, status = await response_cache.get_detail(url, allow_stale_pricing=allow_stale_pricing)
+    if data is not None:
+        CACHE_REQUESTS.inc(kind="detail", result=status)
+        return data, status, 0
+    
+    async def call():
+        result = await unwrangle.detail(url)
+        if result.get("success"):
+            await response_cache.set_detail(url, result)
+        return result
+    
+    async def cached():
+        return (await response_cache.get_detail(url, record=False))[0]
+    
+    async def upstream():
+        return await shared_flight.do(f"detail:{url.strip()}", call, cached)
     
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_variations = []
-    for v in variations:
-        v_upper = v.upper()
-        if v_upper not in seen:
-            seen.add(v_upper)
-            unique_variations.append(v)
-    
-    return unique_variations
-
-def find_matching_variant(search_results: dict, model_number: str, fuzzy: bool = False) -> tuple:
-    """
-    Find the variant that matches the requested model number.
-    Returns tuple: (variant_url, matched_model, match_type)
-    
-    Match types: 'exact', 'variation', 'partial', None
-    """
-    model_upper = model_number.upper().strip()
-    variations = generate_model_variations(model_number) if fuzzy else [model_number]
-    
-    # Try exact matches first
-    for variation in variations:
-        variation_upper = variation.upper().strip()
-        for product in search_results.get("products", []):
-            for variant in product.get("variants", []):
-                variant_model = variant.get("model_no", "").upper().strip()
-                
-                # Exact match
-                if variant_model == variation_upper:
-                    match_type = 'exact' if variation == model_number else 'variation'
-                    return (variant.get("url"), variant.get("model_no"), match_type)
-    
-    # Try partial matches (variant contains search term)
-    if fuzzy:
-        for product in search_results.get("products", []):
-            for variant in product.get("variants", []):
-                variant_model = variant.get("model_no", "").upper().strip()
-                
-                # Partial match - variant contains model number
-                if model_upper in variant_model or variant_model in model_upper:
-                    return (variant.get("url"), variant.get("model_no"), 'partial')
-    
-    return (None, None, None)
+    (data, remote), shared = await inflight.do(("detail", url.strip()), upstream)
+    if shared or remote:
+        CACHE_REQUESTS.inc(kind="detail", result="coalesced")
+        return data, "coalesced", 0
+    CACHE_REQUESTS.inc(kind="detail", result="miss")
+    spend_credits("fergusonhome_detail", data.get("credits_used", 10))
+    return data, "miss", data.get("credits_used", 10)
+
+def spend_credits(platform: str, credits: int):
+    """Count credits in this worker's metrics, the shared per-platform totals and the current client's usage."""
+    CREDITS_SPENT.inc(credits, platform=platform)
+    request_credits = current_credits.get()
+    if request_credits is not None:
+        CLIENT_CREDITS.inc(credits, client=request_credits.client)
+    quotas.charge(credits)
+    credit_counter.add(platform, credits)
+
+def authenticate(x_api_key: Optional[str]) -> Client:
+    client = quotas.authenticate(x_api_key)
+    if client is None:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    return client
+
+def authorize(x_api_key: Optional[str], endpoint: str, credit_budget: Optional[int] = None) -> RequestCredits:
+    """
+    Authenticate the caller and charge this request's upstream credits to it.
+    The returned limit is the smaller of credit_budget and the client's
+    remaining quota; a client with no quota left gets 429.
+    """
+    client = authenticate(x_api_key)
+    quotas.record_request(client.name, endpoint)
+    try:
+        return quotas.begin(client.name, endpoint, credit_budget)
+    except QuotaExceededError as e:
+        raise credit_limit_exception(e)
+
+def credit_limit_exception(e: CreditLimitError) -> HTTPException:
+    """402 for an exhausted credit_budget, 429 with Retry-After for an exhausted client quota."""
+    headers = {"Retry-After": str(math.ceil(e.retry_after))} if isinstance(e, QuotaExceededError) else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+def credit_hold(credits: RequestCredits, worst_case: int, base: int) -> int:
+    """
+    Credits a request should reserve: its worst-case cost, cut to what is left
+    of its budget and quota but never below `base` (the steps it cannot do
+    without), so a request that cannot afford those fails on reserving.
+    """
+    remaining = credits.remaining
+    return worst_case if remaining is None else max(base, min(worst_case, remaining))
+
+@asynccontextmanager
+async def reserved_credits(credits: RequestCredits, amount: int):
+    """Hold `amount` credits of the request's budget and client quota while the block runs (402/429 if they do not fit)."""
+    try:
+        await credits.reserve(amount)
+    except CreditLimitError as e:
+        raise credit_limit_exception(e)
+    try:
+        yield
+    finally:
+        await credits.release(amount)
 
 @app.get("/health")
 async def health_check():
@@ -109,6 +358,16 @@ async def health_check():
         "service": "ferguson-api",
         "version": "1.0.0",
         "unwrangle_configured": bool(UNWRANGLE_API_KEY),
+        "upstream": unwrangle.summary(),
+        "cache": response_cache.summary(),
+        "inflight": inflight.summary(),
+        "workers": {"count": WORKERS, "pid": os.getpid(), "shared_backend": shared_backend.kind,
+                    "shared_flight": shared_flight.summary(),
+                    "credits_spent": credit_counter.totals(("fergusonhome_search", "fergusonhome_detail")),
+                    "credit_write_failures": credit_counter.failed_writes},
+        "catalog": {"enabled": catalog is not None, "products": catalog.count() if catalog is not None else 0, "max_age": CATALOG_MAX_AGE},
+        "refresh": refresher.summary() if refresher is not None else {"enabled": False},
+        "quotas": quotas.summary(),
         "endpoints": {
             "search": "/search-ferguson - Returns BASIC info only (10% of data)",
             "detail": "/product-detail-ferguson - Returns COMPLETE attributes (90% of data)",
@@ -117,6 +376,16 @@ async def health_check():
         "warning": "⚠️ Always use /lookup-ferguson-complete or call both search AND detail endpoints"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of latency histograms, counters and gauges."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/fields")
+async def product_fields():
+    """Product field groups accepted by `fields`, with each field's source priority and default."""
+    return product_schema()
+
 @app.post("/search-ferguson")
 async def search_ferguson_products(request: FergusonSearchRequest, x_api_key: Optional[str] = Header(None)):
     """
@@ -127,29 +396,91 @@ async def search_ferguson_products(request: FergusonSearchRequest, x_api_key: Op
     
     Returns only 10% of product data. Use /lookup-ferguson-complete instead.
     """
-    if x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid API key")
+    credits = authorize(x_api_key, "/search-ferguson", request.credit_budget)
     if not UNWRANGLE_API_KEY:
         raise HTTPException(status_code=500, detail="Unwrangle API key not configured")
     start_time = time.time()
+    # Hold every page the search may fetch; a stream keeps the hold until it has finished
+    budget = credit_hold(credits, 10 * (request.max_pages if request.all_pages else 1), 10)
+    try:
+        await credits.reserve(budget)
+    except CreditLimitError as e:
+        raise credit_limit_exception(e)
+    release = BackgroundTask(credits.release, budget)
     try:
-        params = {"platform": "fergusonhome_search", "search": request.search, "page": request.page, "api_key": UNWRANGLE_API_KEY}
-        response = requests.get("https://data.unwrangle.com/api/getter/", params=params, timeout=45)
-        response.raise_for_status()
-        data = response.json()
+        data, cache_status, credits_spent = await fetch_search(request.search, request.page)
         if not data.get("success"):
             raise HTTPException(status_code=500, detail="Ferguson search unsuccessful")
+        if request.all_pages:
+            max_pages = min(request.max_pages, 1 + max(0, budget - credits_spent) // 10)
+            if request.stream:
+                stream = StreamingResponse(stream_search_pages(request.search, request.page, data, cache_status, credits_spent, max_pages),
+                                           media_type="application/x-ndjson", background=release)
+                release = None  # released by the response once the stream is sent
+                return stream
+            return await merge_search_pages(request.search, request.page, data, cache_status, credits_spent, max_pages, start_time)
         response_time = time.time() - start_time
         return {"success": True, "platform": "fergusonhome_search", "search_query": request.search, "page": request.page,
                 "total_results": data.get("total_results", 0), "total_pages": data.get("no_of_pages", 0),
                 "result_count": data.get("result_count", 0), "products": data.get("results", []),
-                "meta_data": data.get("meta_data", {}), "credits_used": data.get("credits_used", 10),
-                "metadata": {"response_time": f"{response_time:.2f}s", "timestamp": datetime.utcnow().isoformat(), "api_version": "fergusonhome_search_v1"},
+                "meta_data": data.get("meta_data", {}), "credits_used": credits_spent,
+                "metadata": {"response_time": f"{response_time:.2f}s", "timestamp": datetime.utcnow().isoformat(), "api_version": "fergusonhome_search_v1",
+                             "cache": cache_status, "cache_hit": cache_status != "miss"},
                 "warning": "⚠️ INCOMPLETE DATA: This returns only basic info. Call /product-detail-ferguson for complete attributes."}
-    except requests.RequestException as e:
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail=f"Unwrangle API request failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ferguson search failed: {str(e)}")
+    finally:
+        if release is not None:
+            await release()
+
+async def merge_search_pages(query: str, start_page: int, first: dict, cache_status: str, credits: int,
+                             max_pages: int, start_time: float) -> dict:
+    """Fetch the pages after start_page concurrently and merge their products (first occurrence of a product id wins)."""
+    products, seen = [], set()
+    pages, statuses = [], []
+    
+    def add(page: int, data: dict, status: str):
+        pages.append(page)
+        statuses.append(status)
+        for product in data.get("results") or []:
+            key = product.get("id") if product.get("id") is not None else id(product)
+            if key not in seen:
+                seen.add(key)
+                products.append(product)
+    
+    add(start_page, first, cache_status)
+    async with aclosing(iter_search_pages(query, first, start_page, max_pages)) as more:
+        async for page, data, status, page_credits in more:
+            credits += page_credits
+            add(page, data, status)
+    return {"success": True, "platform": "fergusonhome_search", "search_query": query, "page": start_page, "pages": pages,
+            "total_results": first.get("total_results", 0), "total_pages": first.get("no_of_pages", 0),
+            "result_count": len(products), "products": products, "meta_data": first.get("meta_data", {}), "credits_used": credits,
+            "metadata": {"response_time": f"{time.time() - start_time:.2f}s", "timestamp": datetime.utcnow().isoformat(),
+                         "api_version": "fergusonhome_search_v1", "cache": statuses,
+                         "cache_hit": all(status != "miss" for status in statuses)},
+            "warning": "⚠️ INCOMPLETE DATA: This returns only basic info. Call /product-detail-ferguson for complete attributes."}
+
+async def stream_search_pages(query: str, start_page: int, first: dict, cache_status: str, credits: int,
+                              max_pages: int) -> AsyncIterator[str]:
+    """NDJSON: one line per page in page order as soon as it (and every page before it) has arrived."""
+    def line(page: int, data: dict, status: str, page_credits: int) -> str:
+        return json.dumps({"page": page, "total_pages": data.get("no_of_pages", 0), "result_count": data.get("result_count", 0),
+                           "products": data.get("results", []), "cache": status, "credits_used": page_credits}) + "\n"
+    
+    yield line(start_page, first, cache_status, credits)
+    try:
+        async with aclosing(iter_search_pages(query, first, start_page, max_pages)) as more:
+            async for page, data, status, page_credits in more:
+                yield line(page, data, status, page_credits)
+    except (CircuitOpenError, httpx.HTTPError) as e:
+        yield json.dumps({"error": f"Unwrangle API request failed: {str(e)}"}) + "\n"
 
 @app.post("/product-detail-ferguson")
 async def get_ferguson_product_detail(request: FergusonProductRequest, x_api_key: Optional[str] = Header(None)):
@@ -168,65 +499,248 @@ async def get_ferguson_product_detail(request: FergusonProductRequest, x_api_key
     YOU MUST ALWAYS CALL THIS to get complete product attributes!
     This is the 90% of data not returned by search endpoint.
     """
-    if x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid API key")
+    credits = authorize(x_api_key, "/product-detail-ferguson")
     if not UNWRANGLE_API_KEY:
         raise HTTPException(status_code=500, detail="Unwrangle API key not configured")
     start_time = time.time()
     try:
-        import urllib.parse
-        encoded_url = urllib.parse.quote(request.url, safe='')
-        params = {"platform": "fergusonhome_detail", "url": encoded_url, "page": 1, "api_key": UNWRANGLE_API_KEY}
-        response = requests.get("https://data.unwrangle.com/api/getter/", params=params, timeout=45)
-        response.raise_for_status()
-        data = response.json()
+        async with reserved_credits(credits, 10):
+            data, cache_status, credits_spent = await fetch_detail(request.url)
         if not data.get("success"):
             raise HTTPException(status_code=500, detail="Ferguson detail request unsuccessful")
         response_time = time.time() - start_time
         return {"success": True, "platform": "fergusonhome_detail", "url": request.url, "result_count": data.get("result_count", 0),
-                "detail": data.get("detail", {}), "credits_used": data.get("credits_used", 10),
-                "metadata": {"response_time": f"{response_time:.2f}s", "timestamp": datetime.utcnow().isoformat(), "api_version": "fergusonhome_detail_v1"}}
-    except requests.RequestException as e:
+                "detail": data.get("detail", {}), "credits_used": credits_spent,
+                "metadata": {"response_time": f"{response_time:.2f}s", "timestamp": datetime.utcnow().isoformat(), "api_version": "fergusonhome_detail_v1",
+                             "cache": cache_status, "cache_hit": cache_status != "miss"}}
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail=f"Unwrangle API request failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ferguson detail failed: {str(e)}")
 
-@app.post("/lookup-ferguson-complete")
-async def lookup_ferguson_complete(request: FergusonCompleteLookupRequest, x_api_key: Optional[str] = Header(None)):
+async def iter_search_pages(query: str, first: dict, start_page: int = 1, max_pages: int = SEARCH_MAX_PAGES,
+                            concurrency: int = SEARCH_PAGE_CONCURRENCY,
+                            on_unconsumed: Optional[Callable[[int], None]] = None) -> AsyncIterator[tuple]:
     """
-    Complete Ferguson product lookup - executes all 3 steps automatically.
+    Yield (page, search_data, cache_status, credits) for the pages after
+    start_page, in page order, up to no_of_pages of the first response and
+    max_pages in total. Up to `concurrency` pages are fetched ahead; closing
+    the generator early cancels those still in flight and passes the credits
+    of those already fetched (and paid for) to on_unconsumed. Upstream
+    errors propagate.
+    """
+    last = min(int(first.get("no_of_pages") or 0), start_page + max_pages - 1)
+    pages = iter(range(start_page + 1, last + 1))
+    window = deque()
     
-    This is the RECOMMENDED endpoint to use for product enrichment.
-    It handles:
-    1. Searching for the product
-    2. Finding matching variant
-    3. Fetching complete product attributes
+    def fetch_next():
+        page = next(pages, None)
+        if page is not None:
+            window.append((page, asyncio.ensure_future(fetch_search(query, page))))
     
-    Returns: Complete product data ready for enrichment
-    Cost: 20 credits (10 for search + 10 for detail)
+    try:
+        for _ in range(concurrency):
+            fetch_next()
+        while window:
+            page, task = window[0]
+            data, cache_status, credits = await task
+            window.popleft()
+            fetch_next()
+            yield page, data, cache_status, credits
+    finally:
+        for _, task in window:
+            if not task.done():
+                task.cancel()
+            elif on_unconsumed is not None and not task.cancelled() and task.exception() is None:
+                on_unconsumed(task.result()[2])
+
+async def search_next_pages(model_number: str, first: dict, max_pages: int) -> dict:
     """
-    if x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    if not UNWRANGLE_API_KEY:
-        raise HTTPException(status_code=500, detail="Unwrangle API key not configured")
+    Scan the pages after page 1 in order until one gives an exact or variation
+    match for model_number. Pages prefetched past the match are cancelled if
+    still in flight, and an upstream error on a later page just ends the scan.
+    
+    Returns dict: search_data (None if nothing matched), page, cache_status,
+    index (VariantIndex of the matching page), pages (number scanned), credits
+    (including prefetched pages fetched but not scanned)
+    """
+    outcome = {"search_data": None, "page": None, "cache_status": None, "index": None, "pages": 0, "credits": 0}
+    
+    def unconsumed(credits: int):
+        outcome["credits"] += credits
+    
+    try:
+        async with aclosing(iter_search_pages(model_number, first, 1, max_pages, on_unconsumed=unconsumed)) as pages:
+            async for page, data, cache_status, credits in pages:
+                outcome["pages"] += 1
+                outcome["credits"] += credits
+                if not data.get("success") or not data.get("results"):
+                    continue
+                index = VariantIndex(data["results"])
+                match = index.match(model_number, fuzzy=True)
+                if match is not None and match.match_type in ("exact", "variation"):
+                    outcome.update(search_data=data, page=page, cache_status=cache_status, index=index)
+                    break
+    except (CircuitOpenError, httpx.HTTPError) as e:
+        logger.warning("lookup.page_scan_failed model=%s error=%s", model_number, e)
+    return outcome
+
+async def resolve_model_variations(model_number: str, max_searches: int) -> dict:
+    """
+    Search the top-ranked model-number variations concurrently and keep the
+    first search whose results give an exact or variation match. Searches
+    still running at that point are cancelled.
+    
+    Returns dict: search_data (None if nothing matched), query, cache_status,
+    index (VariantIndex of the winning page), searches (number launched),
+    credits (spent by completed searches)
+    """
+    outcome = {"search_data": None, "query": None, "cache_status": None, "index": None, "searches": 0, "credits": 0}
+    candidates = rank_model_variations(model_number)[:max_searches]
+    if not candidates:
+        return outcome
+    
+    tasks = {asyncio.ensure_future(fetch_search(variation, 1)): variation for variation in candidates}
+    outcome["searches"] = len(tasks)
+    pending = set(tasks)
+    try:
+        while pending and outcome["search_data"] is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled() or task.exception() is not None:
+                    continue
+                data, cache_status, credits = task.result()
+                outcome["credits"] += credits
+                if outcome["search_data"] is not None or not data.get("success") or not data.get("results"):
+                    continue
+                index = VariantIndex(data["results"])
+                match = index.match(model_number, fuzzy=True)
+                if match is not None and match.match_type in ("exact", "variation"):
+                    outcome.update(search_data=data, query=tasks[task], cache_status=cache_status, index=index)
+    finally:
+        for task in pending:
+            task.cancel()
+    return outcome
+
+def lookup_catalog(model_number: str, max_age: float, serve_stale: bool = True) -> Optional[dict]:
+    """
+    Stored complete-lookup result for model_number if it is fresher than max_age seconds.
+    
+    With serve_stale, older products (up to CATALOG_STALE_MAX_AGE) are still
+    returned, marked stale, while the refresh scheduler fetches a new copy in
+    the background.
+    """
+    if catalog is None or max_age <= 0:
+        return None
+    found = catalog.lookup_model(model_number)
+    if found is None:
+        return None
+    result, updated_at = found
+    age = time.time() - updated_at
+    stale = age > max_age
+    if stale and (not serve_stale or refresher is None or age > CATALOG_STALE_MAX_AGE):
+        return None
+    refresh_queued = False
+    if refresher is not None:
+        refresher.record_access(model_number, updated_at)
+        if stale:
+            refresh_queued = refresher.schedule(model_number)
+    # The row may have been stored for another requested model (key kept by an earlier lookup) - match this one
+    match = VariantIndex([{"variants": [{"model_no": result.get("matched_model"), "url": result.get("variant_url")}]}]) \
+        .match(model_number, fuzzy=True)
+    if match is not None:
+        result["match_type"], result["match_score"] = match.match_type, match.score
+    result["model_number"] = model_number
+    result["credits_used"] = 0
+    result["metadata"] = {**result.get("metadata", {}), "timestamp": datetime.utcnow().isoformat(), "source": "catalog",
+                          "catalog_age": f"{age:.0f}s", "stale": stale, "refresh_queued": refresh_queued,
+                          "cache_hit": True, "credits_saved": 20}
+    return result
+
+async def refresh_product(model_number: str) -> int:
+    """Background refresh of a catalog product. Returns the credits spent; upstream failures raise."""
+    result = await complete_lookup(model_number, max_catalog_age=0, allow_stale=False)
+    return result["credits_used"]
+
+async def complete_lookup(model_number: str, resolve_variations: bool = False,
+                          max_variation_searches: int = VARIATION_MAX_SEARCHES, credit_budget: Optional[int] = None,
+                          max_search_pages: int = LOOKUP_MAX_PAGES,
+                          max_catalog_age: Optional[float] = None, groups: Optional[set] = None, compact: bool = False,
+                          allow_stale: bool = True) -> dict:
+    """
+    Run the search -> variant match -> detail pipeline for one model number.
+    Raises HTTPException on failure.
+    
+    Results stored in the local catalog within max_catalog_age seconds
+    (default CATALOG_MAX_AGE) are returned without any upstream call. With
+    the default, older ones are served stale while they are refreshed.
     
-    model_number = request.model_number
+    With max_search_pages > 1, a first page without an exact/variation match
+    is followed by the next pages in order (prefetched concurrently) until
+    one matches. With resolve_variations, if still nothing matched, parallel
+    searches over ranked model-number variations follow (bounded by
+    max_variation_searches). credit_budget caps both.
+    
+    allow_stale=False (catalog refreshes) disables partial detail hits and the
+    fallback to the stored catalog product when Unwrangle is unavailable.
+    
+    groups / compact project the product (see fields.py). Without a catalog
+    only the requested groups are merged; with one the full product is built
+    and stored, then projected.
+    """
     overall_start = time.time()
     
+    # An explicit max_catalog_age is a hard limit; only the default one serves stale products while they refresh
+    stored = lookup_catalog(model_number, CATALOG_MAX_AGE if max_catalog_age is None else max_catalog_age,
+                            serve_stale=max_catalog_age is None)
+    if stored is not None:
+        stored["performance"] = {"total_time": f"{time.time() - overall_start:.2f}s"}
+        return project_result(stored, groups, compact)
+    
     try:
         # STEP 1: Search for product
-        print(f"Step 1: Searching for model {model_number}...")
+        logger.debug("lookup.search model=%s", model_number)
         step1_start = time.time()
-        search_params = {
-            "api_key": UNWRANGLE_API_KEY,
-            "platform": "fergusonhome_search",
-            "search": model_number,
-            "page": 1
-        }
-        search_response = requests.get("https://data.unwrangle.com/api/getter/", params=search_params, timeout=45)
-        search_response.raise_for_status()
-        search_data = search_response.json()
+        search_data, search_cache, search_credits = await fetch_search(model_number, 1)
+        search_query = model_number
+        search_page = 1
+        pages_scanned = 1
+        variation_searches = 0
+        index = None  # VariantIndex of the search page, built once
+        
+        if max_search_pages > 1 or resolve_variations:
+            index = VariantIndex(search_data.get("results") or [])
+            raw_match = index.match(model_number, fuzzy=True)
+            weak_match = raw_match is None or raw_match.match_type == "partial"
+            if weak_match and max_search_pages > 1 and search_data.get("success"):
+                max_pages = max_search_pages
+                if credit_budget is not None:
+                    # Reserve 10 credits for the detail fetch; each page may cost 10
+                    max_pages = min(max_pages, 1 + max(0, (credit_budget - search_credits - 10) // 10))
+                scanned = await search_next_pages(model_number, search_data, max_pages)
+                search_credits += scanned["credits"]
+                pages_scanned += scanned["pages"]
+                if scanned["search_data"] is not None:
+                    search_data, search_page, search_cache = scanned["search_data"], scanned["page"], scanned["cache_status"]
+                    index, weak_match = scanned["index"], False
+            if weak_match and resolve_variations:
+                max_searches = max_variation_searches
+                if credit_budget is not None:
+                    # Reserve 10 credits for the detail fetch; each variation search may cost 10
+                    max_searches = min(max_searches, max(0, (credit_budget - search_credits - 10) // 10))
+                logger.info("lookup.resolve_variations model=%s max_searches=%d", model_number, max_searches)
+                resolved = await resolve_model_variations(model_number, max_searches)
+                search_credits += resolved["credits"]
+                variation_searches = resolved["searches"]
+                if resolved["search_data"] is not None:
+                    search_data, search_query, search_cache = resolved["search_data"], resolved["query"], resolved["cache_status"]
+                    index = resolved["index"]
         step1_time = time.time() - step1_start
+        STAGE_DURATION.observe(step1_time, stage="search")
         
         if not search_data.get("success"):
             raise HTTPException(status_code=404, detail="Product not found in Ferguson")
@@ -237,36 +751,24 @@ async def lookup_ferguson_complete(request: FergusonCompleteLookupRequest, x_api
                 detail=f"No products found for model {model_number}"
             )
         
-        print(f"Step 1: ✓ Found {len(search_data.get('results', []))} products ({step1_time:.2f}s)")
+        logger.debug("lookup.search_done model=%s products=%d cache=%s seconds=%.3f",
+                     model_number, len(search_data.get("results", [])), search_cache, step1_time)
         
         # STEP 2: Find matching variant with smart format-aware matching
-        print(f"Step 2: Finding variant match for {model_number} (with format variations)...")
         step2_start = time.time()
         
-        # Store search result data before matching
-        search_product_data = None
-        for product in search_data.get("results", []):
-            for variant in product.get("variants", []):
-                if variant.get("model_no", "").upper().strip() == model_number.upper().strip():
-                    search_product_data = product  # Store the parent product data
-                    break
-            if search_product_data:
-                break
-        
-        # Use smart matching with fuzzy=True
-        match_result = find_matching_variant(
-            {"products": search_data.get("results", [])},
-            model_number,
-            fuzzy=True
-        )
+        # Index the page once; exact/variation matches are hash lookups and the
+        # parent search product comes back with the match
+        if index is None:
+            index = VariantIndex(search_data.get("results", []))
+        match = index.match(model_number, fuzzy=True)
         step2_time = time.time() - step2_start
+        STAGE_DURATION.observe(step2_time, stage="match")
         
-        if not match_result:
+        if match is None or not match.url:
+            MATCH_TYPES.inc(match_type="none")
             # Return available variants for debugging
-            available_variants = []
-            for product in search_data.get("results", []):
-                for variant in product.get("variants", []):
-                    available_variants.append(variant.get("model_no"))
+            available_variants = index.models
             
             raise HTTPException(
                 status_code=404,
@@ -280,14 +782,14 @@ async def lookup_ferguson_complete(request: FergusonCompleteLookupRequest, x_api
                 }
             )
         
-        # Unpack the result tuple
-        variant_url, matched_model, match_type = match_result
-        print(f"Step 2: ✓ Matched '{model_number}' → '{matched_model}' ({match_type} match, {step2_time:.2f}s)")
+        variant_url, matched_model, match_type = match.url, match.model_no, match.match_type
+        search_product_data = match.product  # Parent product data from search
+        MATCH_TYPES.inc(match_type=match_type)
+        logger.debug("lookup.matched model=%s matched=%s match_type=%s seconds=%.3f", model_number, matched_model, match_type, step2_time)
         
         # STEP 3: Get complete product details
-        print(f"Step 3: Fetching complete product attributes...")
+        logger.debug("lookup.detail model=%s url=%s", model_number, variant_url)
         step3_start = time.time()
-        import urllib.parse
         
         # Ensure variant_url is a string before encoding
         if not isinstance(variant_url, str):
@@ -296,17 +798,8 @@ async def lookup_ferguson_complete(request: FergusonCompleteLookupRequest, x_api
                 detail=f"Invalid variant URL type: {type(variant_url)}"
             )
         
-        encoded_url = urllib.parse.quote(variant_url, safe='')
-        
-        detail_params = {
-            "api_key": UNWRANGLE_API_KEY,
-            "platform": "fergusonhome_detail",
-            "url": encoded_url,
-            "page": 1
-        }
-        detail_response = requests.get("https://data.unwrangle.com/api/getter/", params=detail_params, timeout=45)
-        detail_response.raise_for_status()
-        detail_data = detail_response.json()
+        # Pricing/inventory can come from the search result when only static specs are cached
+        detail_data, detail_cache, detail_credits = await fetch_detail(variant_url, allow_stale_pricing=allow_stale and search_product_data is not None)
         step3_time = time.time() - step3_start
         
         if not detail_data.get("success"):
@@ -315,120 +808,22 @@ async def lookup_ferguson_complete(request: FergusonCompleteLookupRequest, x_api
                 detail="Failed to fetch product details"
             )
         
-        print(f"Step 3: ✓ Retrieved complete product data ({step3_time:.2f}s)")
+        STAGE_DURATION.observe(step3_time, stage="detail")
+        logger.debug("lookup.detail_done model=%s cache=%s seconds=%.3f", model_number, detail_cache, step3_time)
         
         # Return COMPLETE product information - MERGE data from BOTH search and detail endpoints
         product_detail = detail_data.get("detail", {})
         overall_time = time.time() - overall_start
         
-        return {
+        result = {
             "success": True,
             "model_number": model_number,
             "matched_model": matched_model,
             "match_type": match_type,
+            "match_score": match.score,
             "variant_url": variant_url,
-            "product": {
-                # ========== BASIC INFORMATION (merged from both endpoints) ==========
-                "id": product_detail.get("id") or (search_product_data.get("id") if search_product_data else None),
-                "family_id": search_product_data.get("family_id") if search_product_data else None,  # ONLY in search
-                "name": product_detail.get("name") or (search_product_data.get("name") if search_product_data else None),
-                "brand": product_detail.get("brand") or (search_product_data.get("brand") if search_product_data else None),
-                "brand_url": product_detail.get("brand_url"),
-                "brand_logo": product_detail.get("brand_logo"),
-                "model_number": product_detail.get("model_number"),
-                "url": product_detail.get("url"),
-                "product_type": product_detail.get("product_type"),
-                "application": product_detail.get("application"),
-                
-                # ========== PRICING & INVENTORY (merged from both endpoints) ==========
-                "price": product_detail.get("price") or (search_product_data.get("price") if search_product_data else None),
-                "price_min": search_product_data.get("price_min") if search_product_data else None,  # ONLY in search
-                "price_max": search_product_data.get("price_max") if search_product_data else None,  # ONLY in search
-                "unit_price": search_product_data.get("unit_price") if search_product_data else None,  # ONLY in search
-                "price_type": search_product_data.get("price_type") if search_product_data else None,  # ONLY in search
-                "price_range": product_detail.get("price_range", {}),
-                "currency": product_detail.get("currency") or (search_product_data.get("currency") if search_product_data else None),
-                "base_type": product_detail.get("base_type"),
-                "shipping_fee": product_detail.get("shipping_fee"),
-                "has_free_installation": product_detail.get("has_free_installation"),
-                
-                # ========== INVENTORY & VARIANTS (merged from both endpoints) ==========
-                "variants": product_detail.get("variants", []) or (search_product_data.get("variants", []) if search_product_data else []),
-                "variant_count": product_detail.get("variant_count") or (search_product_data.get("variant_count") if search_product_data else None),
-                "has_variant_groups": product_detail.get("has_variant_groups"),
-                "has_in_stock_variants": product_detail.get("has_in_stock_variants") or (search_product_data.get("has_in_stock_variants") if search_product_data else None),
-                "all_variants_in_stock": product_detail.get("all_variants_in_stock") or (search_product_data.get("all_variants_in_stock") if search_product_data else None),
-                "all_variants_restricted": search_product_data.get("all_variants_restricted") if search_product_data else None,  # ONLY in search
-                "total_inventory_quantity": product_detail.get("total_inventory_quantity") or (search_product_data.get("total_inventory_quantity") if search_product_data else None),
-                "in_stock_variant_count": product_detail.get("in_stock_variant_count") or (search_product_data.get("in_stock_variant_count") if search_product_data else None),
-                "is_configurable": product_detail.get("is_configurable") or (search_product_data.get("is_configurable") if search_product_data else None),
-                "is_square_footage_based": search_product_data.get("is_square_footage_based") if search_product_data else None,  # ONLY in search
-                "configuration_type": product_detail.get("configuration_type"),
-                
-                # ========== IMAGES & VIDEOS (merged from both endpoints) ==========
-                "images": product_detail.get("images", []) or (search_product_data.get("images", []) if search_product_data else []),
-                "thumbnail": product_detail.get("thumbnail") or (search_product_data.get("thumbnail") if search_product_data else None),
-                "videos": product_detail.get("videos", []),
-                
-                # ========== PRODUCT DETAILS ==========
-                "description": product_detail.get("description"),
-                "is_discontinued": product_detail.get("is_discontinued"),
-                
-                # ========== SPECIFICATIONS (CRITICAL!) ==========
-                "specifications": product_detail.get("specifications", {}),
-                "feature_groups": product_detail.get("feature_groups", []),
-                "dimensions": product_detail.get("dimensions", {}),
-                "attribute_ids": product_detail.get("attribute_ids", []),
-                
-                # ========== IDENTIFIERS ==========
-                "upc": product_detail.get("upc"),
-                "barcode": product_detail.get("barcode"),
-                
-                # ========== CERTIFICATIONS & COMPLIANCE ==========
-                "certifications": product_detail.get("certifications", []),
-                "country_of_origin": product_detail.get("country_of_origin"),
-                
-                # ========== WARRANTY ==========
-                "warranty": product_detail.get("warranty"),
-                "manufacturer_warranty": product_detail.get("manufacturer_warranty"),
-                
-                # ========== RESOURCES & DOCUMENTATION ==========
-                "resources": product_detail.get("resources", []),
-                
-                # ========== CATEGORIES ==========
-                "categories": product_detail.get("categories", []),
-                "base_category": product_detail.get("base_category"),
-                "business_category": product_detail.get("business_category"),
-                "related_categories": product_detail.get("related_categories", []),
-                
-                # ========== REVIEWS & RATINGS (merged from both endpoints) ==========
-                "rating": product_detail.get("rating") or (search_product_data.get("rating") if search_product_data else None),
-                "total_ratings": search_product_data.get("total_ratings") if search_product_data else None,  # ONLY in search (same as total_reviews)
-                "review_count": product_detail.get("review_count"),
-                "total_reviews": product_detail.get("total_reviews") or (search_product_data.get("total_ratings") if search_product_data else None),
-                "questions_count": product_detail.get("questions_count"),
-                
-                # ========== COLLECTION (merged from both endpoints) ==========
-                "collection": product_detail.get("collection") or (search_product_data.get("collection") if search_product_data else None),
-                
-                # ========== SHIPPING INFO (from search) ==========
-                "is_quick_ship": search_product_data.get("is_quick_ship") if search_product_data else None,  # ONLY in search
-                "shipping_info": search_product_data.get("shipping_info") if search_product_data else None,  # ONLY in search (different from detail)
-                
-                # ========== SPECIAL FLAGS (from search) ==========
-                "is_appointment_only_brand": search_product_data.get("is_appointment_only_brand") if search_product_data else None,  # ONLY in search
-                
-                # ========== RELATED PRODUCTS & OPTIONS ==========
-                "has_recommended_options": product_detail.get("has_recommended_options"),
-                "recommended_options": product_detail.get("recommended_options", []),
-                "has_accessories": product_detail.get("has_accessories"),
-                "has_replacement_parts": product_detail.get("has_replacement_parts"),
-                "replacement_parts_url": product_detail.get("replacement_parts_url"),
-                
-                # ========== SPECIAL FLAGS ==========
-                "is_by_appointment_only": product_detail.get("is_by_appointment_only")
-            },
-            "credits_used": 20,
+            "product": build_product(product_detail, search_product_data, None if catalog is not None else groups),
+            "credits_used": search_credits + detail_credits,
             "steps_completed": {
                 "1_search": "✓",
                 "2_variant_match": "✓",
@@ -444,26 +839,323 @@ async def lookup_ferguson_complete(request: FergusonCompleteLookupRequest, x_api
             "metadata": {
                 "timestamp": datetime.utcnow().isoformat(),
                 "api_version": "ferguson_complete_v1",
-                "data_sources": "merged_search_and_detail"
+                "data_sources": "merged_search_and_detail",
+                "source": "unwrangle",
+                "stale": False,
+                "search_query": search_query,
+                "search_page": search_page,
+                "search_pages_scanned": pages_scanned,
+                "variation_searches": variation_searches,
+                "cache": {"search": search_cache, "detail": detail_cache},
+                "cache_hit": search_cache != "miss" and detail_cache != "miss",
+                "credits_saved": (10 if search_cache != "miss" else 0) + (10 if detail_cache != "miss" else 0)
             }
         }
         
+        if catalog is not None and detail_cache != "partial":  # keep search-filled pricing out of the catalog
+            catalog.save(result)
+            if refresher is not None:
+                refresher.mark_refreshed(model_number, time.time())
+        return project_result(result, groups, compact)
+        
     except HTTPException:
         raise
+    except (CircuitOpenError, httpx.HTTPError) as e:
+        # Upstream unhealthy - serve the last known catalog product of any age
+        stored = lookup_catalog(model_number, float("inf")) if allow_stale else None
+        if stored is not None:
+            stored["metadata"].update(stale=True, degraded=True, upstream_error=str(e))
+            return project_result(stored, groups, compact)
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if isinstance(e, CircuitOpenError) else None
+        raise HTTPException(status_code=503, detail=f"Unwrangle API request failed: {str(e)}", headers=headers)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Complete lookup failed: {str(e)}"
         )
 
+@app.post("/lookup-ferguson-complete")
+async def lookup_ferguson_complete(request: FergusonCompleteLookupRequest, x_api_key: Optional[str] = Header(None)):
+    """
+    Complete Ferguson product lookup - executes all 3 steps automatically.
+    
+    This is the RECOMMENDED endpoint to use for product enrichment.
+    It handles:
+    1. Searching for the product
+    2. Finding matching variant
+    3. Fetching complete product attributes
+    
+    Returns: Complete product data ready for enrichment
+    Cost: up to 20 credits (10 for search + 10 for detail, cached steps are
+    free) - `credits_used` reports what the call actually spent
+    
+    Set resolve_variations=true to search ranked format variations (K- prefix,
+    hyphens, ...) in parallel when the raw model number has no match. Each
+    variation search costs up to 10 more credits; cap them with credit_budget.
+    
+    `fields` limits the product to the listed groups (basic, pricing, media,
+    ...) and `compact` drops null values - both shrink the response body.
+    """
+    credits = authorize(x_api_key, "/lookup-ferguson-complete", request.credit_budget)
+    if not UNWRANGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Unwrangle API key not configured")
+    
+    # Hold the worst case - every page, every variation search and the detail - or what is left of it,
+    # but at least search + detail; the lookup may spend only what it holds
+    variation_searches = request.max_variation_searches if request.resolve_variations else 0
+    budget = credit_hold(credits, 10 * (request.max_search_pages + variation_searches + 1), 20)
+    async with reserved_credits(credits, budget):
+        return await complete_lookup(request.model_number, resolve_variations=request.resolve_variations,
+                                     max_variation_searches=request.max_variation_searches, credit_budget=budget,
+                                     max_search_pages=request.max_search_pages,
+                                     max_catalog_age=request.max_catalog_age, groups=parse_fields(request.fields),
+                                     compact=request.compact)
+
+async def lookup_outcome(model_number: str, groups: Optional[set] = None, compact: bool = False,
+                         credit_budget: Optional[int] = None) -> dict:
+    """Run complete_lookup and capture the result or error as a per-item outcome (never raises HTTPException)."""
+    try:
+        data = await complete_lookup(model_number, credit_budget=credit_budget, groups=groups, compact=compact)
+        return {"status": "ok", "status_code": 200, "data": data}
+    except HTTPException as e:
+        status = "not_found" if e.status_code == 404 else "error"
+        return {"status": status, "status_code": e.status_code, "error": e.detail}
+
+async def budgeted_outcome(model_number: str, groups: Optional[set] = None, compact: bool = False) -> dict:
+    """
+    lookup_outcome within the current request's credit limit (batch, export
+    and job items). An item that cannot reserve LOOKUP_RESERVE credits, even
+    after the items in flight have settled, is not started and fails with
+    402 (credit_budget) or 429 (client quota).
+    """
+    credits = current_credits.get()
+    if credits is None or credits.remaining is None:
+        return await lookup_outcome(model_number, groups=groups, compact=compact)
+    try:
+        await credits.reserve(LOOKUP_RESERVE)
+    except CreditLimitError as e:
+        return {"status": "error", "status_code": e.status_code, "error": str(e)}
+    try:
+        return await lookup_outcome(model_number, groups=groups, compact=compact, credit_budget=LOOKUP_RESERVE)
+    finally:
+        await credits.release(LOOKUP_RESERVE)
+
+async def job_lookup(model_number: str, client: Optional[str]) -> dict:
+    """Job item lookup, charged to the client that submitted the job and stopped by its quota."""
+    if client is None:
+        current_credits.set(None)
+    else:
+        try:
+            quotas.begin(client, "/jobs")
+        except QuotaExceededError as e:
+            return {"status": "error", "status_code": 429, "error": str(e)}
+    return await budgeted_outcome(model_number)
+
+@app.post("/lookup-ferguson-batch")
+async def lookup_ferguson_batch(request: FergusonBatchLookupRequest, x_api_key: Optional[str] = Header(None)):
+    """
+    Complete lookup for many model numbers at once.
+    
+    Runs the same search -> match -> detail pipeline as /lookup-ferguson-complete
+    for every model concurrently (bounded by `concurrency`). Duplicate model
+    numbers are collapsed, and duplicate variant URLs share one detail fetch
+    through the cache / in-flight coalescing.
+    
+    Returns one result per requested model with its own status - a failed
+    item does not fail the batch. With credit_budget, each item reserves its
+    worst-case cost before it starts; items that do not fit are skipped.
+    """
+    credits = authorize(x_api_key, "/lookup-ferguson-batch", request.credit_budget)
+    if not UNWRANGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Unwrangle API key not configured")
+    
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(request.concurrency or BATCH_CONCURRENCY)
+    groups = parse_fields(request.fields)
+    
+    # Collapse duplicates (same normalized model number) to one lookup
+    unique_models = {}
+    for model in request.model_numbers:
+        unique_models.setdefault(normalize_query(model), model.strip())
+    
+    async def run_one(model: str) -> dict:
+        async with semaphore:
+            return await budgeted_outcome(model, groups=groups, compact=request.compact)
+    
+    keys = list(unique_models)
+    outcomes = await asyncio.gather(*(run_one(unique_models[key]) for key in keys))
+    by_key = dict(zip(keys, outcomes))
+    
+    results = [{"model_number": model, **by_key[normalize_query(model)]} for model in request.model_numbers]
+    succeeded = sum(1 for o in outcomes if o["status"] == "ok")
+    return {
+        "success": True,
+        "total_requested": len(request.model_numbers),
+        "unique_models": len(keys),
+        "succeeded": succeeded,
+        "failed": len(keys) - succeeded,
+        "results": results,
+        "credits_used": credits.spent,
+        "metadata": {
+            "response_time": f"{time.time() - start_time:.2f}s",
+            "timestamp": datetime.utcnow().isoformat(),
+            "api_version": "ferguson_batch_v1"
+        }
+    }
+
+@app.post("/export")
+async def export_products(request: Request, format: str = Query("ndjson", description="ndjson or csv"),
+                          start: int = Query(0, ge=0, description="Skip the first N models (resume after N received rows)"),
+                          concurrency: Optional[int] = Query(None, ge=1, le=50, description=f"Parallel lookups (default {EXPORT_CONCURRENCY})"),
+                          fields: Optional[List[str]] = Query(None, description="Product field groups (repeat or comma-separate)"),
+                          compact: bool = Query(False),
+                          credit_budget: Optional[int] = Query(None, ge=0, description="Credits the export may spend - later rows fail with 402"),
+                          x_api_key: Optional[str] = Header(None)):
+    """
+    Stream complete lookups for an uploaded model-number list.
+    
+    The body is the list itself - one model number per line (or a CSV whose
+    first column is the model number). Results are streamed in input order as
+    NDJSON (one outcome per line, like /jobs/{job_id}/results) or as CSV with
+    one column per product field, each row as soon as it is ready.
+    
+    The upload is spooled to disk and at most a few lookup windows are held
+    in memory, so list size is unbounded. After an interrupted download, send
+    the same list again with start=<rows received> to continue.
+    """
+    authorize(x_api_key, "/export", credit_budget)
+    if not UNWRANGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Unwrangle API key not configured")
+    try:
+        groups = parse_fields([name for value in fields or [] for name in value.split(",")])
+        formatter = RowFormatter(format, selected_fields(groups))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    lines = io.TextIOWrapper(spool, encoding="utf-8-sig")
+    
+    async def body():
+        try:
+            async for line in stream_export(iter_models(lines), lambda model: budgeted_outcome(model, groups=groups, compact=compact),
+                                            formatter, concurrency or EXPORT_CONCURRENCY, start):
+                yield line
+        finally:
+            lines.close()
+    
+    return StreamingResponse(body(), media_type=formatter.media_type,
+                             headers={"Content-Disposition": f'attachment; filename="ferguson-export.{format}"'})
+
+@app.post("/jobs")
+async def submit_lookup_job(request: FergusonJobRequest, x_api_key: Optional[str] = Header(None)):
+    """
+    Submit a large enrichment run as a background job.
+    
+    Returns a job id immediately. Items are processed by the background
+    worker pool with the /lookup-ferguson-complete pipeline; poll
+    /jobs/{job_id} for progress and read /jobs/{job_id}/results for results.
+    Credits are charged to the submitting client; items fail with 429 once
+    its quota is used up.
+    """
+    credits = authorize(x_api_key, "/jobs")
+    if not UNWRANGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Unwrangle API key not configured")
+    job_id = app.state.jobs.submit([model.strip() for model in request.model_numbers], client=credits.client)
+    return {"success": True, "job_id": job_id, "total": len(request.model_numbers),
+            "status_url": f"/jobs/{job_id}", "results_url": f"/jobs/{job_id}/results"}
+
+@app.get("/jobs/{job_id}")
+async def get_lookup_job(job_id: str, x_api_key: Optional[str] = Header(None)):
+    """Job progress and per-status counts."""
+    client = authenticate(x_api_key)
+    job = app.state.jobs.store.get_job(job_id)
+    if job is None or job["client"] not in (None, client.name):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {"success": True, **job}
+
+@app.get("/jobs/{job_id}/results")
+async def stream_lookup_job_results(job_id: str, x_api_key: Optional[str] = Header(None)):
+    """
+    Stream finished results as NDJSON (one outcome per line, completion order).
+    The stream stays open while the job is running and ends when it completes.
+    """
+    client = authenticate(x_api_key)
+    job = app.state.jobs.store.get_job(job_id)
+    if job is None or job["client"] not in (None, client.name):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return StreamingResponse(app.state.jobs.stream_results(job_id), media_type="application/x-ndjson")
+
+@app.get("/catalog/products")
+async def query_catalog(x_api_key: Optional[str] = Header(None),
+                        brand: Optional[str] = None, category: Optional[str] = None, collection: Optional[str] = None,
+                        model_number: Optional[str] = None, upc: Optional[str] = None,
+                        product_id: Optional[str] = None, family_id: Optional[str] = None,
+                        limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """
+    Query the local product catalog built from previous complete lookups.
+    Never calls Unwrangle - costs 0 credits. Filters are combined with AND.
+    """
+    authenticate(x_api_key)
+    if catalog is None:
+        raise HTTPException(status_code=503, detail="Local catalog is disabled (CATALOG_DB_PATH)")
+    total, rows = catalog.query(brand=brand, collection=collection, category=category, model_number=model_number,
+                                upc=upc, product_id=product_id, family_id=family_id, limit=limit, offset=offset)
+    return {"success": True, "total": total, "count": len(rows), "limit": limit, "offset": offset,
+            "products": [{"matched_model": result.get("matched_model"), "variant_url": result.get("variant_url"),
+                          "updated_at": datetime.utcfromtimestamp(updated_at).isoformat(), "product": result.get("product", {})}
+                         for result, updated_at in rows],
+            "credits_used": 0}
+
+@app.get("/usage")
+async def get_usage(x_api_key: Optional[str] = Header(None)):
+    """Credits and requests of the calling API key in the current quota period, in total and per endpoint."""
+    client = authenticate(x_api_key)
+    return {"success": True, **quotas.usage(client.name)}
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc: HTTPException):
-    return JSONResponse(status_code=exc.status_code, content={"success": False, "error": exc.detail})
+    return JSONResponse(status_code=exc.status_code, content={"success": False, "error": exc.detail}, headers=exc.headers)
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc: Exception):
     return JSONResponse(status_code=500, content={"success": False, "error": f"Internal server error: {str(exc)}"})
 
+async def run_export(args) -> dict:
+    """CLI export: the complete lookup pipeline without the HTTP server."""
+    groups = parse_fields(args.fields.split(",") if args.fields else None)
+    formatter = RowFormatter(args.format, selected_fields(groups))
+    await unwrangle.start()
+    try:
+        return await export_to_file(args.input, args.output, lambda model: lookup_outcome(model, groups=groups, compact=args.compact),
+                                    formatter, concurrency=args.concurrency, resume=args.resume)
+    finally:
+        await unwrangle.close()
+        await credit_counter.wait()
+        response_cache.close()
+        if catalog is not None:
+            catalog.close()
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=PORT, reload=False)
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        import argparse
+        parser = argparse.ArgumentParser(prog="main.py export", description="Export complete lookups for a model-number list")
+        parser.add_argument("input", help="File with one model number per line (or CSV, first column)")
+        parser.add_argument("-o", "--output", required=True, help="Output file (<output>.checkpoint holds resume state)")
+        parser.add_argument("-f", "--format", choices=["ndjson", "csv"], default="ndjson")
+        parser.add_argument("--fields", help="Comma-separated product field groups (default all)")
+        parser.add_argument("--compact", action="store_true", help="Leave null values out (NDJSON)")
+        parser.add_argument("--concurrency", type=int, default=EXPORT_CONCURRENCY)
+        parser.add_argument("--resume", action="store_true", help="Continue an interrupted export from its checkpoint")
+        cli_args = parser.parse_args(sys.argv[2:])
+        if not UNWRANGLE_API_KEY:
+            parser.error("UNWRANGLE_API_KEY is not configured")
+        try:
+            print(json.dumps(asyncio.run(run_export(cli_args)), indent=2), file=sys.stderr)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        import uvicorn
+        uvicorn.run("main:app", host="0.0.0.0", port=PORT, reload=False, workers=WORKERS)
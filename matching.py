@@ -0,0 +1,144 @@
+"""Variant matching - model number variations and an indexed matcher over search results"""
+import re
+from typing import NamedTuple, Optional
+
+def generate_model_variations(model_number: str) -> list:
+    """
+    Generate common model number format variations for smart matching.
+    Returns list of possible variations to try.
+    """
+    model = model_number.strip()
+    variations = [model]  # Original
+    
+    # Common brand prefixes
+    prefixes = ["K-", "G-", "M-", "A-"]
+    for prefix in prefixes:
+        if not model.upper().startswith(prefix.upper()):
+            variations.append(f"{prefix}{model}")
+    
+    # Add/remove hyphens
+    if "-" in model:
+        variations.append(model.replace("-", ""))  # Remove all hyphens
+    else:
+        # Try adding hyphens in common positions
+        if len(model) > 4:
+            # Format: G9104BNI -> G-9104-BNI
+            if model[0].isalpha() and model[1:5].isdigit():
+                variations.append(f"{model[0]}-{model[1:5]}-{model[5:]}")
+            # Format: 97621SHP -> 97621-SHP
+            for i in range(2, len(model)-1):
+                if model[i].isalpha() and model[i-1].isdigit():
+                    variations.append(f"{model[:i]}-{model[i:]}")
+                    break
+    
+    # Remove duplicates while preserving order
+    seen = set()
+    unique_variations = []
+    for v in variations:
+        v_upper = v.upper()
+        if v_upper not in seen:
+            seen.add(v_upper)
+            unique_variations.append(v)
+    
+    return unique_variations
+
+def rank_model_variations(model_number: str) -> list:
+    """
+    Variations of model_number (excluding the original) ordered by how likely
+    they are to be Ferguson's listed format: hyphen changes first, then brand
+    prefixes in K-, G-, M-, A- order.
+    """
+    model = model_number.strip()
+    prefixes = ["K-", "G-", "M-", "A-"]
+    
+    def rank(variation: str) -> int:
+        for i, prefix in enumerate(prefixes):
+            if variation.upper().startswith(prefix) and not model.upper().startswith(prefix):
+                return i + 1
+        return 0
+    
+    return sorted(generate_model_variations(model)[1:], key=rank)
+
+def normalize_model(model_number: Optional[str]) -> str:
+    return (model_number or "").upper().strip()
+
+def compact_model(model_number: Optional[str]) -> str:
+    """Model number with separators removed: 'K-97621-SHP' -> 'K97621SHP'."""
+    return re.sub(r"[^A-Z0-9]", "", normalize_model(model_number))
+
+class VariantMatch(NamedTuple):
+    url: Optional[str]
+    model_no: Optional[str]
+    match_type: str  # 'exact', 'variation' or 'partial'
+    variant: dict
+    product: dict  # parent product from the search results
+    score: float
+
+class VariantIndex:
+    """
+    Lookup index over one page of search results.
+
+    Every variant model_no is normalized once; exact and variation matches are
+    then dict lookups. Partial matches are ranked by partial_score() instead of
+    taking the first containment hit.
+    """
+
+    # Shorter side of a partial match must have at least this many characters
+    MIN_PARTIAL_LENGTH = 4
+
+    def __init__(self, products: list):
+        self.products = products or []
+        self._by_model = {}
+        self._entries = []  # (normalized, compact, variant, product) in result order
+        for product in self.products:
+            for variant in product.get("variants", []) or []:
+                key = normalize_model(variant.get("model_no"))
+                if not key:
+                    continue
+                self._entries.append((key, compact_model(key), variant, product))
+                self._by_model.setdefault(key, (variant, product))  # first occurrence wins, like a scan
+
+    @property
+    def models(self) -> list:
+        return [variant.get("model_no") for _, _, variant, _ in self._entries]
+
+    def get(self, model_number: str) -> Optional[tuple]:
+        """(variant, product) for an exact normalized model number, or None."""
+        return self._by_model.get(normalize_model(model_number))
+
+    @classmethod
+    def partial_score(cls, query: str, candidate: str) -> float:
+        """
+        Score a partial match between compact model numbers.
+        0 if neither contains the other (or the shorter one is too short),
+        otherwise len(shorter) / len(longer), with a small bonus when the
+        candidate contains the query (the listing adds a prefix/suffix).
+        """
+        shorter, longer = sorted((query, candidate), key=len)
+        if len(shorter) < cls.MIN_PARTIAL_LENGTH or shorter not in longer:
+            return 0.0
+        return len(shorter) / len(longer) + (0.001 if query in candidate else 0.0)
+
+    def match(self, model_number: str, fuzzy: bool = False) -> Optional[VariantMatch]:
+        """Best match for model_number: exact, then format variations, then best-scoring partial (fuzzy only)."""
+        requested = normalize_model(model_number)
+        variations = generate_model_variations(model_number) if fuzzy else [model_number]
+        for variation in variations:
+            found = self.get(variation)
+            if found is not None:
+                variant, product = found
+                match_type = "exact" if normalize_model(variation) == requested else "variation"
+                return VariantMatch(variant.get("url"), variant.get("model_no"), match_type, variant, product, 1.0)
+        
+        if not fuzzy:
+            return None
+        query = compact_model(requested)
+        best, best_score = None, 0.0
+        for _, compact, variant, product in self._entries:
+            score = self.partial_score(query, compact)
+            if score > best_score:
+                best, best_score = (variant, product), score
+        if best is None:
+            return None
+        variant, product = best
+        return VariantMatch(variant.get("url"), variant.get("model_no"), "partial", variant, product, round(best_score, 4))
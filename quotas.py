@@ -0,0 +1,304 @@
+"""API clients, per-client credit quotas and credit usage accounting"""
+import asyncio
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, NamedTuple, Optional
+from shared import LocalBackend
+
+PERIODS = ("day", "month")
+USAGE_RETENTION = 400 * 86400.0  # usage records are kept this long in the backend
+
+class Client(NamedTuple):
+    """An API key holder. quota is credits per period (None = unlimited)."""
+    name: str
+    key: str
+    quota: Optional[int] = None
+
+def parse_clients(spec: str) -> list:
+    """Clients from an API_KEYS value: comma-separated name:key[:quota] (empty quota = unlimited)."""
+    clients = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split(":")
+        if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+            raise ValueError(f"API_KEYS entry {item!r} must be name:key or name:key:quota")
+        try:
+            quota = int(parts[2]) if len(parts) == 3 and parts[2] else None
+        except ValueError:
+            raise ValueError(f"API_KEYS entry {item!r}: quota must be a whole number of credits")
+        clients.append(Client(parts[0], parts[1], quota))
+    for attr in ("name", "key"):
+        values = [getattr(c, attr) for c in clients]
+        if len(set(values)) != len(values):
+            raise ValueError(f"API_KEYS has duplicate client {attr}s")
+    return clients
+
+def period_bounds(period: str, now: float) -> tuple:
+    """Returns tuple: (label, start, end) of the UTC day or month containing now."""
+    moment = datetime.fromtimestamp(now, timezone.utc)
+    if period == "day":
+        start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start.strftime("%Y-%m-%d"), start.timestamp(), (start + timedelta(days=1)).timestamp()
+    start = moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return start.strftime("%Y-%m"), start.timestamp(), (start + timedelta(days=32)).replace(day=1).timestamp()
+
+class CreditLimitError(Exception):
+    """A request step does not fit the credits left to the request. status_code is the HTTP status to answer with."""
+    status_code = 402
+
+class BudgetExceededError(CreditLimitError):
+    """The step does not fit the request's credit_budget."""
+
+    def __init__(self, credits: int, budget: int):
+        super().__init__(f"Credit budget exhausted: {credits} more credits do not fit credit_budget {budget}")
+        self.credits = credits
+        self.budget = budget
+
+class QuotaExceededError(CreditLimitError):
+    """The client has (nearly) used its credit quota for the current period."""
+    status_code = 429
+
+    def __init__(self, client: str, quota: int, retry_after: float):
+        super().__init__(f"Credit quota of {quota} for client {client!r} is used up for this period")
+        self.client = client
+        self.quota = quota
+        self.retry_after = retry_after
+
+class RequestCredits:
+    """
+    Credit accounting for one API request (or job item): which client pays,
+    how much was spent and how much may still be spent.
+
+    Every step that may spend credits reserves its worst-case cost first,
+    against the request's budget (credit_budget) and, through `quotas`, the
+    client's quota - which also holds the reservations of the client's other
+    requests. A reservation that does not fit waits while this request has
+    others outstanding (they usually spend less than reserved) and only
+    fails once spent + reserved leaves no room.
+    """
+
+    def __init__(self, client: str, endpoint: str, budget: Optional[int] = None, quotas: Optional["QuotaManager"] = None):
+        self.client = client
+        self.endpoint = endpoint
+        self.budget = budget
+        self.quotas = quotas
+        self.spent = 0
+        self.reserved = 0
+        self._settled = asyncio.Condition()
+
+    @property
+    def remaining(self) -> Optional[int]:
+        """Credits the request may still spend: the smaller of budget and quota left (None = unbounded)."""
+        limits = [] if self.budget is None else [max(0, self.budget - self.spent - self.reserved)]
+        quota_left = self.quotas.remaining(self.client) if self.quotas is not None else None
+        if quota_left is not None:
+            limits.append(quota_left)
+        return min(limits) if limits else None
+
+    def _check(self, credits: int) -> Optional[CreditLimitError]:
+        if self.budget is not None and self.budget - self.spent - self.reserved < credits:
+            return BudgetExceededError(credits, self.budget)
+        if self.quotas is not None:
+            quota_left = self.quotas.remaining(self.client)
+            if quota_left is not None and quota_left < credits:
+                return self.quotas.exceeded(self.client)
+        return None
+
+    async def reserve(self, credits: int):
+        """Hold credits for a step. Raises BudgetExceededError or QuotaExceededError when they do not fit."""
+        async with self._settled:
+            while True:
+                error = self._check(credits)
+                if error is None:
+                    break
+                if self.reserved == 0:
+                    raise error
+                await self._settled.wait()
+            self.reserved += credits
+            if self.quotas is not None:
+                self.quotas.hold(self.client, credits)
+
+    async def release(self, credits: int):
+        async with self._settled:
+            self.reserved -= credits
+            if self.quotas is not None:
+                self.quotas.hold(self.client, -credits)
+            self._settled.notify_all()
+
+# Set per request by QuotaManager.begin(); tasks started by the request inherit it
+current_credits: ContextVar[Optional[RequestCredits]] = ContextVar("current_credits", default=None)
+
+def _empty_usage() -> dict:
+    return {"credits": 0, "requests": 0, "endpoints": {}}
+
+def _merge_usage(total: Optional[dict], delta: dict) -> dict:
+    """New usage record: total plus delta (neither is modified)."""
+    merged = {"credits": (total or {}).get("credits", 0) + delta["credits"],
+              "requests": (total or {}).get("requests", 0) + delta["requests"],
+              "endpoints": {name: dict(counts) for name, counts in (total or {}).get("endpoints", {}).items()}}
+    for name, counts in delta["endpoints"].items():
+        entry = merged["endpoints"].setdefault(name, {"credits": 0, "requests": 0})
+        entry["credits"] += counts["credits"]
+        entry["requests"] += counts["requests"]
+    return merged
+
+class QuotaManager:
+    """
+    Per-client credit usage for the current period (UTC day or month).
+
+    Quota checks and charges are dict operations on in-memory totals. Every
+    flush_interval seconds the pending usage is added to `backend` (see
+    shared.py) with an atomic update() and the totals are read back, so with
+    a shared backend each worker also sees the others' usage - a quota is
+    therefore enforced with up to one flush interval of lag.
+    """
+
+    def __init__(self, clients: Iterable[Client], backend=None, period: str = "month", flush_interval: float = 10.0):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown quota period {period!r} - use {' or '.join(PERIODS)}")
+        self.clients = {client.key: client for client in clients}
+        self.by_name = {client.name: client for client in self.clients.values()}
+        self.backend = backend or LocalBackend()
+        self.period = period
+        self.flush_interval = flush_interval
+        self._totals = {}  # client name -> usage persisted in the backend (all workers) as of the last flush
+        self._pending = {}  # client name -> usage not flushed yet
+        self._held = {}  # client name -> credits reserved by requests in flight
+        self._task = None
+        self._start_period(time.time())
+
+    def _start_period(self, now: float):
+        self.period_label, self.period_start, self.period_end = period_bounds(self.period, now)
+        self._totals = {}
+
+    def _key(self, name: str) -> str:
+        return f"usage:{self.period_label}:{name}"
+
+    def _roll(self):
+        if time.time() >= self.period_end:
+            try:
+                self.flush()  # pending usage belongs to the period that just ended
+            except Exception:
+                pass  # kept pending - counted in the new period
+            self._start_period(time.time())
+
+    def authenticate(self, key: Optional[str]) -> Optional[Client]:
+        return self.clients.get(key) if key else None
+
+    def used(self, name: str) -> int:
+        self._roll()
+        return self._totals.get(name, {}).get("credits", 0) + self._pending.get(name, {}).get("credits", 0)
+
+    def remaining(self, name: str) -> Optional[int]:
+        """Quota left after usage and the reservations of requests in flight (None = unlimited)."""
+        client = self.by_name.get(name)
+        if client is None or client.quota is None:
+            return None
+        return max(0, client.quota - self.used(name) - self._held.get(name, 0))
+
+    def hold(self, name: str, credits: int):
+        self._held[name] = self._held.get(name, 0) + credits
+
+    def exceeded(self, name: str) -> QuotaExceededError:
+        return QuotaExceededError(name, self.by_name[name].quota, self.period_end - time.time())
+
+    def _add(self, name: str, endpoint: str, credits: int = 0, requests: int = 0):
+        self._roll()
+        entry = self._pending.get(name)
+        if entry is None:
+            entry = self._pending[name] = _empty_usage()
+        entry["credits"] += credits
+        entry["requests"] += requests
+        counts = entry["endpoints"].get(endpoint)
+        if counts is None:
+            counts = entry["endpoints"][endpoint] = {"credits": 0, "requests": 0}
+        counts["credits"] += credits
+        counts["requests"] += requests
+
+    def record_request(self, name: str, endpoint: str):
+        self._add(name, endpoint, requests=1)
+
+    def begin(self, name: str, endpoint: str, credit_budget: Optional[int] = None) -> RequestCredits:
+        """
+        Start credit accounting for a request by client `name` in the current
+        context. Raises QuotaExceededError when the quota is used up.
+        """
+        remaining = self.remaining(name)
+        if remaining == 0:
+            raise self.exceeded(name)
+        credits = RequestCredits(name, endpoint, credit_budget, self if remaining is not None else None)
+        current_credits.set(credits)
+        return credits
+
+    def charge(self, credits: int):
+        """Charge credits spent upstream to the current request's client (no-op outside a request)."""
+        current = current_credits.get()
+        if current is None or not credits:
+            return
+        current.spent += credits
+        self._add(current.client, current.endpoint, credits=credits)
+
+    def flush(self):
+        """
+        Add pending usage to the backend. A client whose usage fails to persist
+        keeps it pending; the others are still flushed and the first error is
+        raised at the end.
+        """
+        pending, self._pending = self._pending, {}
+        error = None
+        for name, delta in pending.items():
+            try:
+                self._totals[name] = self.backend.update(self._key(name), lambda total: _merge_usage(total, delta),
+                                                         ttl=USAGE_RETENTION)
+            except Exception as e:
+                retry = self._pending.get(name)  # charged since the swap
+                self._pending[name] = delta if retry is None else _merge_usage(delta, retry)
+                error = error or e
+        if error is not None:
+            raise error
+
+    def refresh(self):
+        """Re-read every client's persisted usage (picks up other workers' spend)."""
+        for name in self.by_name:
+            entry = self.backend.get(self._key(name))
+            self._totals[name] = entry[0] if entry is not None else _empty_usage()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+                self.refresh()
+            except Exception:
+                pass  # retried on the next flush
+
+    async def start(self):
+        self.refresh()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+    def usage(self, name: str) -> dict:
+        """Usage of one client in the current period, including unflushed usage."""
+        self._roll()
+        usage = _merge_usage(self._totals.get(name), self._pending.get(name, _empty_usage()))
+        client = self.by_name.get(name)
+        quota = client.quota if client is not None else None
+        return {"client": name, "period": self.period_label,
+                "period_start": datetime.fromtimestamp(self.period_start, timezone.utc).isoformat(),
+                "period_end": datetime.fromtimestamp(self.period_end, timezone.utc).isoformat(),
+                "quota": quota, "credits_used": usage["credits"],
+                "credits_remaining": None if quota is None else max(0, quota - usage["credits"]),
+                "requests": usage["requests"], "endpoints": usage["endpoints"]}
+
+    def summary(self) -> dict:
+        return {"clients": len(self.clients), "period": self.period_label, "flush_interval": self.flush_interval,
+                "credits_used": sum(self.used(name) for name in self.by_name)}
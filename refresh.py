@@ -0,0 +1,158 @@
+"""Background refresh - stale-while-revalidate for catalog products under a credit budget"""
+import asyncio
+import itertools
+import time
+from typing import Awaitable, Callable, Optional
+from cache import normalize_query
+from shared import LocalBackend
+
+class RefreshScheduler:
+    """
+    Refreshes stored products in the background.
+
+    Callers serve the last known product immediately and schedule() a refresh.
+    Products accessed often are also refreshed ahead of expiry: every
+    scan_interval seconds, tracked products older than refresh_ahead * max_age
+    are queued, hottest first (access counts decay with a one-hour half-life).
+    Refreshes stop when credits spent in the last minute reach
+    credits_per_minute. The spend window lives in `backend` (see shared.py),
+    so with a shared backend the budget covers every worker together.
+
+    `refresh` takes a model number, fetches it from upstream and returns the
+    credits it used.
+    """
+
+    HALF_LIFE = 3600.0
+
+    def __init__(self, refresh: Callable[[str], Awaitable[int]], max_age: float, credits_per_minute: int = 200,
+                 refresh_ahead: float = 0.8, cost_estimate: int = 20, workers: int = 2, scan_interval: float = 60.0,
+                 max_tracked: int = 10000, backend=None):
+        self.refresh = refresh
+        self.max_age = max_age
+        self.credits_per_minute = credits_per_minute
+        self.refresh_ahead = refresh_ahead
+        self.cost_estimate = cost_estimate
+        self.worker_count = workers
+        self.scan_interval = scan_interval
+        self.max_tracked = max_tracked
+        self._access = {}  # normalized model -> {"model_number", "hits", "last_access", "updated_at"}
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._queued = set()
+        self._order = itertools.count()
+        self.backend = backend or LocalBackend()  # "refresh:spent" holds [timestamp, credits] pairs of the last minute
+        self._tasks = []
+        self.stats = {"scheduled": 0, "proactive": 0, "refreshed": 0, "failed": 0, "budget_waits": 0, "credits_spent": 0}
+
+    def _heat(self, entry: dict, now: float) -> float:
+        return entry["hits"] * 0.5 ** ((now - entry["last_access"]) / self.HALF_LIFE)
+
+    def record_access(self, model_number: str, updated_at: float):
+        """Count an access to a stored product (drives proactive refresh priority)."""
+        now = time.time()
+        key = normalize_query(model_number)
+        entry = self._access.get(key)
+        if entry is None:
+            entry = self._access[key] = {"model_number": model_number.strip(), "hits": 0.0, "last_access": now}
+        entry["hits"] = self._heat(entry, now) + 1
+        entry["last_access"] = now
+        entry["updated_at"] = updated_at
+        if len(self._access) > self.max_tracked * 1.1:
+            coldest = sorted(self._access, key=lambda k: self._heat(self._access[k], now))
+            for stale_key in coldest[:len(self._access) - self.max_tracked]:
+                del self._access[stale_key]
+
+    def mark_refreshed(self, model_number: str, updated_at: float):
+        entry = self._access.get(normalize_query(model_number))
+        if entry is not None:
+            entry["updated_at"] = updated_at
+
+    def schedule(self, model_number: str, priority: Optional[float] = None) -> bool:
+        """Queue a refresh. Returns False if one is already queued or running."""
+        key = normalize_query(model_number)
+        if key in self._queued:
+            return False
+        if priority is None:
+            entry = self._access.get(key)
+            priority = self._heat(entry, time.time()) if entry else 1.0
+        self._queued.add(key)
+        self._queue.put_nowait((-priority, next(self._order), model_number.strip()))
+        self.stats["scheduled"] += 1
+        return True
+
+    def budget_used(self) -> int:
+        found = self.backend.get("refresh:spent")
+        cutoff = time.time() - 60
+        return sum(credits for at, credits in (found[0] if found else []) if at >= cutoff)
+
+    def _spend(self, credits: int, check_budget: bool = False) -> float:
+        """Record credits in the window. With check_budget, only if they fit - returns seconds to wait otherwise (else 0)."""
+        wait = [0.0]
+
+        def spend(spent):
+            now = time.time()
+            spent = [entry for entry in spent or [] if entry[0] >= now - 60]
+            if check_budget and spent and sum(c for _, c in spent) + credits > self.credits_per_minute:
+                wait[0] = spent[0][0] + 60 - now
+                return spent
+            return spent + [[now, credits]]
+
+        self.backend.update("refresh:spent", spend, ttl=120)
+        return wait[0]
+
+    async def _reserve_budget(self):
+        while True:
+            wait = await asyncio.to_thread(self._spend, self.cost_estimate, True)
+            if wait <= 0:
+                return
+            self.stats["budget_waits"] += 1
+            await asyncio.sleep(max(wait, 0.1))
+
+    async def _worker(self):
+        while True:
+            _, _, model_number = await self._queue.get()
+            try:
+                await self._reserve_budget()
+                credits = await self.refresh(model_number)
+                # Replace the estimate with what the refresh actually spent
+                await asyncio.to_thread(self._spend, credits - self.cost_estimate)
+                self.stats["credits_spent"] += credits
+                self.stats["refreshed"] += 1
+                self.mark_refreshed(model_number, time.time())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.stats["failed"] += 1
+            finally:
+                self._queued.discard(normalize_query(model_number))
+                self._queue.task_done()
+
+    def scan(self) -> int:
+        """Queue tracked products that are close to expiry. Returns the number queued."""
+        now = time.time()
+        threshold = self.max_age * self.refresh_ahead
+        queued = 0
+        for key, entry in list(self._access.items()):
+            if now - entry["updated_at"] >= threshold and key not in self._queued:
+                if self.schedule(entry["model_number"], self._heat(entry, now)):
+                    queued += 1
+        self.stats["proactive"] += queued
+        return queued
+
+    async def _scan_loop(self):
+        while True:
+            await asyncio.sleep(self.scan_interval)
+            self.scan()
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self._tasks.append(asyncio.create_task(self._scan_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def summary(self) -> dict:
+        return {"tracked": len(self._access), "queued": self._queue.qsize(), "credits_per_minute": self.credits_per_minute,
+                "credits_last_minute": self.budget_used(), **self.stats}
@@ -0,0 +1,205 @@
+"""Upstream resilience - adaptive rate limiting and circuit breaking for Unwrangle calls"""
+import asyncio
+import time
+from typing import Optional
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Unwrangle circuit open - retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate adapts to upstream behaviour (AIMD).
+
+    Each success under target_latency adds `increase` req/s up to max_rate.
+    A 429 halves the rate (down to min_rate) and pauses the bucket for the
+    Retry-After period; slow responses shrink the rate by 10%.
+    """
+
+    def __init__(self, rate: float = 5.0, min_rate: float = 0.5, max_rate: float = 20.0, burst: int = 10,
+                 target_latency: float = 20.0, increase: float = 0.1):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.target_latency = target_latency
+        self.increase = increase
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.stats = {"throttled": 0, "waits": 0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:  # FIFO - waiters take tokens in arrival order
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                self.stats["waits"] += 1
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                await asyncio.sleep(max(wait, 0.01))
+
+    async def on_success(self, latency: float):
+        if latency > self.target_latency:
+            self.rate = max(self.min_rate, self.rate * 0.9)
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    async def on_throttle(self, retry_after: Optional[float] = None):
+        self.stats["throttled"] += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = min(self._tokens, 0.0)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def summary(self) -> dict:
+        self._refill(time.monotonic())
+        return {"rate_per_second": round(self.rate, 3), "min_rate": self.min_rate, "max_rate": self.max_rate,
+                "burst": self.burst, "tokens": round(self._tokens, 2),
+                "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1), **self.stats}
+
+class SharedRateLimiter(AdaptiveRateLimiter):
+    """
+    AdaptiveRateLimiter whose bucket, rate and pause live in a shared backend
+    (see shared.py), so every worker draws from one Unwrangle rate budget and
+    a 429 seen by one worker slows all of them down. Backend updates run in a
+    thread, off the event loop.
+    """
+
+    def __init__(self, backend, key: str = "ratelimit:unwrangle", **kwargs):
+        super().__init__(**kwargs)
+        self.backend = backend
+        self.key = key
+
+    def _state(self, state: Optional[dict], now: float) -> dict:
+        state = dict(state) if state else {"tokens": float(self.burst), "updated": now, "rate": self.rate, "paused_until": 0.0}
+        state["tokens"] = min(self.burst, state["tokens"] + max(0.0, now - state["updated"]) * state["rate"])
+        state["updated"] = now
+        return state
+
+    def _take(self) -> float:
+        """Take a token if one is available. Returns 0 on success, else the seconds to wait."""
+        wait = [0.0]
+
+        def take(current):
+            now = time.time()
+            state = self._state(current, now)
+            if now >= state["paused_until"] and state["tokens"] >= 1:
+                state["tokens"] -= 1
+                wait[0] = 0.0
+            else:
+                wait[0] = max(state["paused_until"] - now, (1 - state["tokens"]) / state["rate"])
+            self.rate = state["rate"]
+            return state
+
+        self.backend.update(self.key, take, ttl=3600)
+        return wait[0]
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                wait = await asyncio.to_thread(self._take)
+                if wait <= 0:
+                    return
+                self.stats["waits"] += 1
+                await asyncio.sleep(min(max(wait, 0.01), 1.0))
+
+    async def _adjust(self, fn):
+        def apply(current):
+            state = self._state(current, time.time())
+            fn(state)
+            self.rate = state["rate"]
+            return state
+        await asyncio.to_thread(self.backend.update, self.key, apply, ttl=3600)
+
+    async def on_success(self, latency: float):
+        if latency > self.target_latency:
+            await self._adjust(lambda state: state.update(rate=max(self.min_rate, state["rate"] * 0.9)))
+        else:
+            await self._adjust(lambda state: state.update(rate=min(self.max_rate, state["rate"] + self.increase)))
+
+    async def on_throttle(self, retry_after: Optional[float] = None):
+        self.stats["throttled"] += 1
+
+        def throttle(state):
+            state.update(rate=max(self.min_rate, state["rate"] / 2), tokens=min(state["tokens"], 0.0))
+            if retry_after:
+                state["paused_until"] = max(state["paused_until"], time.time() + retry_after)
+        await self._adjust(throttle)
+
+    def summary(self) -> dict:
+        found = self.backend.get(self.key)
+        state = self._state(found[0] if found else None, time.time())
+        return {"rate_per_second": round(state["rate"], 3), "min_rate": self.min_rate, "max_rate": self.max_rate,
+                "burst": self.burst, "tokens": round(state["tokens"], 2),
+                "paused_for": round(max(0.0, state["paused_until"] - time.time()), 1), "shared": True, **self.stats}
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker.
+
+    failure_threshold consecutive failures open the circuit; calls then fail
+    fast with CircuitOpenError for recovery_timeout seconds, after which a
+    limited number of probe calls are let through. A successful probe closes
+    the circuit, a failed one re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def before_call(self):
+        if self.state == "open":
+            remaining = self._opened_at + self.recovery_timeout - time.monotonic()
+            if remaining > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(remaining)
+            self.state = "half_open"
+            self._probes = 0
+        if self.state == "half_open":
+            if self._probes >= self.half_open_max_calls:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.recovery_timeout)
+            self._probes += 1
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+
+    def record_success(self):
+        self._failures = 0
+        self.state = "closed"
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            self._open()
+
+    def release(self):
+        """Neutral outcome (throttled, cancelled) - frees a half-open probe slot without changing state."""
+        if self.state == "half_open":
+            self._probes = max(0, self._probes - 1)
+
+    def summary(self) -> dict:
+        summary = {"state": self.state, "consecutive_failures": self._failures,
+                   "failure_threshold": self.failure_threshold, "recovery_timeout": self.recovery_timeout, **self.stats}
+        if self.state == "open":
+            summary["retry_in"] = round(max(0.0, self._opened_at + self.recovery_timeout - time.monotonic()), 1)
+        return summary
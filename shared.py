@@ -0,0 +1,254 @@
+"""Shared state backends - cache entries, leases, rate-limit and credit state shared by every worker process"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+from cache import SQLiteCache
+
+try:
+    import redis
+except ImportError:  # optional - only needed for SHARED_BACKEND=redis://...
+    redis = None
+
+NO_EXPIRY = 10 * 365 * 86400.0
+
+class LocalBackend:
+    """
+    In-process state for a single worker (the default).
+
+    Every backend stores JSON values with a TTL and offers update(), an
+    atomic read-modify-write: fn receives the current value (None if
+    missing) and returns the new one - returning None deletes the key,
+    returning the same object leaves it untouched.
+    """
+
+    shared = False
+    kind = "local"
+
+    def __init__(self):
+        self._values = {}  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def _read(self, key: str):
+        entry = self._values.get(key)
+        if entry is None or entry[1] <= time.time():
+            self._values.pop(key, None)
+            return None
+        return entry
+
+    def get(self, key: str):
+        """Return (value, remaining_ttl) or None."""
+        with self._lock:
+            entry = self._read(key)
+        return None if entry is None else (entry[0], entry[1] - time.time())
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        with self._lock:
+            self._values[key] = (value, time.time() + (ttl or NO_EXPIRY))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None):
+        with self._lock:
+            entry = self._read(key)
+            current = None if entry is None else entry[0]
+            new = fn(current)
+            if new is None:
+                self._values.pop(key, None)
+            elif new is not current:
+                self._values[key] = (new, time.time() + (ttl or NO_EXPIRY))
+            return new
+
+    def close(self):
+        pass
+
+class SQLiteBackend(SQLiteCache):
+    """
+    State shared by worker processes on one host through a SQLite file in WAL
+    mode. update() runs in a BEGIN IMMEDIATE transaction, which serializes
+    writers across processes.
+    """
+
+    shared = True
+    kind = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn.execute("PRAGMA busy_timeout = 5000")
+        self._conn.isolation_level = None  # explicit transactions in update()
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        super().set(key, value, ttl or NO_EXPIRY)
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+                current = json.loads(row[0]) if row is not None and row[1] > time.time() else None
+                new = fn(current)
+                if new is None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                elif new is not current:
+                    self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                                       (key, json.dumps(new), time.time() + (ttl or NO_EXPIRY)))
+                self._conn.execute("COMMIT")
+                return new
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+class RedisBackend:
+    """
+    State shared by workers on any number of hosts through Redis (or any
+    server speaking its protocol). update() is an optimistic WATCH/MULTI
+    transaction retried on conflict. Needs the `redis` package.
+    """
+
+    shared = True
+    kind = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "ferguson:", client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("SHARED_BACKEND=redis:// needs the redis package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self.prefix + key)
+        pipe.pttl(self.prefix + key)
+        value, pttl = pipe.execute()
+        if value is None:
+            return None
+        return json.loads(value), (pttl / 1000 if pttl and pttl > 0 else NO_EXPIRY)
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        self.client.set(self.prefix + key, json.dumps(value), px=int((ttl or NO_EXPIRY) * 1000))
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None):
+        name = self.prefix + key
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    current = json.loads(raw) if raw is not None else None
+                    new = fn(current)
+                    pipe.multi()
+                    if new is None:
+                        pipe.delete(name)
+                    elif new is not current:
+                        pipe.set(name, json.dumps(new), px=int((ttl or NO_EXPIRY) * 1000))
+                    pipe.execute()
+                    return new
+                except redis.WatchError:
+                    continue
+
+    def purge_expired(self) -> int:
+        return 0  # Redis expires keys itself
+
+    def close(self):
+        self.client.close()
+
+def create_backend(url: Optional[str]):
+    """Backend for a SHARED_BACKEND url: '' / 'local', 'sqlite:///path/to/file.db' or 'redis://host:port/db'."""
+    if not url or url == "local":
+        return LocalBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported SHARED_BACKEND {url!r} - use local, sqlite:///<path> or redis://<host>")
+
+class SharedFlight:
+    """
+    Cross-process single-flight on top of a shared backend.
+
+    The first worker to take the lease for a key runs the call; others poll
+    `check` (normally the shared cache) until the result appears, the lease
+    is released or it expires - then they try to take it themselves. With a
+    LocalBackend the call simply runs (in-process SingleFlight covers it).
+    Lease calls run in a thread, off the event loop.
+    """
+
+    def __init__(self, backend, lease: float = 60.0, poll_interval: float = 0.1):
+        self.backend = backend
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.stats = {"leaders": 0, "followers": 0, "takeovers": 0}
+
+    def _acquire(self, key: str, token: str) -> bool:
+        return self.backend.update(key, lambda current: token if current is None else current, ttl=self.lease) == token
+
+    def _release(self, key: str, token: str):
+        self.backend.update(key, lambda current: None if current == token else current)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], check: Callable[[], Awaitable[Any]]) -> tuple:
+        """Returns tuple: (result, shared) - shared is True when another worker made the call."""
+        if not self.backend.shared:
+            return await fn(), False
+        key = "lease:" + key
+        token = uuid.uuid4().hex
+        waited = False
+        while True:
+            if await asyncio.to_thread(self._acquire, key, token):
+                self.stats["takeovers" if waited else "leaders"] += 1
+                try:
+                    return await fn(), False
+                finally:
+                    await asyncio.to_thread(self._release, key, token)  # runs to the end even if we are cancelled
+            waited = True
+            while await asyncio.to_thread(self.backend.get, key) is not None:
+                await asyncio.sleep(self.poll_interval)
+                result = await check()
+                if result is not None:
+                    self.stats["followers"] += 1
+                    return result, True
+            result = await check()
+            if result is not None:
+                self.stats["followers"] += 1
+                return result, True
+
+    def summary(self) -> dict:
+        return dict(self.stats)
+
+class CreditCounter:
+    """
+    Credits spent per platform, totalled across every worker sharing the
+    backend. add() writes in a background thread so the caller neither
+    blocks nor yields; writes that fail are counted in failed_writes.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.failed_writes = 0
+        self._writes = set()
+
+    def add(self, platform: str, credits: int):
+        if credits:
+            task = asyncio.ensure_future(asyncio.to_thread(self.backend.update, f"credits:{platform}",
+                                                           lambda total: (total or 0) + credits))
+            self._writes.add(task)
+            task.add_done_callback(self._written)
+
+    def _written(self, task):
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.failed_writes += 1
+
+    async def wait(self):
+        """Wait for the writes in flight (before the backend is closed)."""
+        await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def totals(self, platforms: tuple) -> dict:
+        return {platform: (self.backend.get(f"credits:{platform}") or (0, 0))[0] for platform in platforms}
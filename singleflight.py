@@ -0,0 +1,48 @@
+"""Single-flight - concurrent callers asking for the same key share one in-flight call"""
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent upstream calls.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight await the same task and receive the same result (or exception).
+    The task is shielded so one caller being cancelled does not cancel it for
+    the others; it is only cancelled once every caller has gone.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "cancelled": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> tuple:
+        """Returns tuple: (result, shared) - shared is True when this call was coalesced."""
+        entry = self._inflight.get(key)
+        shared = entry is not None
+        if shared:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            entry = self._inflight[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.stats["leaders"] += 1
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"]), shared
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                # Every caller was cancelled - abandon the upstream call
+                self.stats["cancelled"] += 1
+                entry["task"].cancel()
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        entry = self._inflight.get(key)
+        if entry is not None and entry["task"] is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away
+
+    def summary(self) -> dict:
+        return {"in_flight": len(self._inflight), **self.stats}
@@ -0,0 +1,141 @@
+"""Unwrangle API client - shared async connection pool for all Ferguson calls"""
+import asyncio
+import random
+import time
+import urllib.parse
+from typing import Optional
+import httpx
+from resilience import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError
+from metrics import UPSTREAM_DURATION, UPSTREAM_ERRORS, UPSTREAM_IN_FLIGHT
+
+UNWRANGLE_URL = "https://data.unwrangle.com/api/getter/"
+
+class UnwrangleClient:
+    """
+    Async client for the Unwrangle getter API.
+
+    One instance is shared by every endpoint so keep-alive connections are
+    reused across requests. Call start() / close() from the app lifespan.
+    
+    Every call passes the circuit breaker and rate limiter. Getter calls are
+    idempotent, so transport errors, 429 and 5xx responses are retried up to
+    max_retries times with full-jitter exponential backoff (honouring
+    Retry-After) while the retry_deadline allows.
+    """
+
+    def __init__(self, api_key: Optional[str], base_url: str = UNWRANGLE_URL,
+                 max_connections: int = 50, max_keepalive: int = 20, keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 45.0,
+                 limiter: Optional[AdaptiveRateLimiter] = None, breaker: Optional[CircuitBreaker] = None,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_cap: float = 8.0, retry_deadline: float = 60.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_deadline = retry_deadline
+        self.stats = {"calls": 0, "retries": 0, "errors": 0}
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        try:
+            return float(response.headers.get("Retry-After", ""))
+        except ValueError:
+            return None
+
+    async def _send(self, params: dict) -> tuple:
+        """
+        One attempt through the breaker and limiter.
+        Returns tuple: (data, error, retry_after) - error is set when the attempt may be retried.
+        Raises CircuitOpenError, and non-retryable httpx errors.
+        """
+        platform = params.get("platform", "")
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            UPSTREAM_ERRORS.inc(platform=platform, type="circuit_open")
+            raise
+        outcome = "neutral"
+        try:
+            await self.limiter.acquire()
+            self.stats["calls"] += 1
+            started = time.monotonic()
+            try:
+                with UPSTREAM_IN_FLIGHT.track_inprogress(), UPSTREAM_DURATION.time(platform=platform):
+                    response = await self._client.get(self.base_url, params={**params, "api_key": self.api_key})
+            except httpx.TransportError as e:
+                outcome = "failure"
+                UPSTREAM_ERRORS.inc(platform=platform, type="timeout" if isinstance(e, httpx.TimeoutException) else "transport")
+                return None, e, None
+            if response.status_code == 429:
+                UPSTREAM_ERRORS.inc(platform=platform, type="http_429")
+                retry_after = self._retry_after(response)
+                await self.limiter.on_throttle(retry_after)
+                return None, httpx.HTTPStatusError("Unwrangle rate limit (429)", request=response.request, response=response), retry_after
+            if response.status_code >= 500:
+                outcome = "failure"
+                UPSTREAM_ERRORS.inc(platform=platform, type="http_5xx")
+                return None, httpx.HTTPStatusError(f"Unwrangle server error ({response.status_code})",
+                                                   request=response.request, response=response), self._retry_after(response)
+            outcome = "success"
+            await self.limiter.on_success(time.monotonic() - started)
+            if response.status_code >= 400:
+                UPSTREAM_ERRORS.inc(platform=platform, type="http_4xx")
+            response.raise_for_status()  # other 4xx - not retried
+            return response.json(), None, None
+        finally:
+            if outcome == "success":
+                self.breaker.record_success()
+            elif outcome == "failure":
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+
+    async def get(self, params: dict) -> dict:
+        """Call the getter endpoint and return the decoded JSON body. Raises httpx.HTTPError or CircuitOpenError on failure."""
+        if self._client is None:
+            await self.start()
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            data, error, retry_after = await self._send(params)
+            if error is None:
+                return data
+            delay = self._backoff(attempt, retry_after)
+            if attempt >= self.max_retries or time.monotonic() - started + delay > self.retry_deadline:
+                self.stats["errors"] += 1
+                raise error
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def summary(self) -> dict:
+        return {"circuit_breaker": self.breaker.summary(), "rate_limiter": self.limiter.summary(),
+                "max_retries": self.max_retries, **self.stats}
+
+    async def search(self, query: str, page: int = 1) -> dict:
+        return await self.get({"platform": "fergusonhome_search", "search": query, "page": page})
+
+    async def detail(self, url: str) -> dict:
+        # Unwrangle expects the product URL pre-encoded (it is encoded again as a query param)
+        encoded_url = urllib.parse.quote(url, safe='')
+        return await self.get({"platform": "fergusonhome_detail", "url": encoded_url, "page": 1})